@@ -0,0 +1,249 @@
+"""Офлайн-бенчмарк конвеєра завантаження на локальному макеті Civitai.
+
+    python benchmark.py --images 500 --size 200000 --workers 1,4,8,16
+
+Макет HTTP-сервера відтворює /api/v1/images з пагінацією через
+metadata.nextPage і віддає зображення заданого розміру з затримкою та,
+за бажанням, відповіддю 429 на кожен N-й запит. Для кожного значення
+workers справжній DownloadPipeline запускається в окремому процесі, тож
+пікова пам'ять і час процесора міряються саме для завантажувача.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import resource  # Лише Unix
+except ImportError:
+    resource = None
+
+MODEL_ID = "1"
+
+
+class MockCivitaiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        if server.take_throttle():
+            self.send_body(429, b"", {"Retry-After": str(server.retry_after)})
+            return
+        url = urlparse(self.path)
+        if url.path == "/api/v1/images":
+            time.sleep(server.api_latency)
+            self.send_page(parse_qs(url.query))
+        elif url.path.startswith("/img/"):
+            time.sleep(server.image_latency)
+            image_id = int(os.path.splitext(os.path.basename(url.path))[0])
+            self.send_body(200, server.image_body(image_id),
+                           {"Content-Type": "image/png", "ETag": f'"{image_id}"'})
+        else:
+            self.send_body(404, b"")
+
+    def send_page(self, query):
+        server = self.server
+        limit = int(query.get("limit", ["100"])[0])
+        cursor = int(query.get("cursor", ["0"])[0])
+        host = self.headers["Host"]
+        items = [{"id": i, "url": f"http://{host}/img/{i}.png", "meta": {"prompt": f"prompt {i}"}}
+                 for i in range(cursor, min(cursor + limit, server.total_images))]
+        metadata = {}
+        if cursor + limit < server.total_images:
+            metadata["nextPage"] = f"http://{host}/api/v1/images?limit={limit}&cursor={cursor + limit}"
+        body = json.dumps({"items": items, "metadata": metadata}).encode()
+        self.send_body(200, body, {"Content-Type": "application/json"})
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockCivitaiServer(ThreadingHTTPServer):
+    """Локальний замінник API та CDN Civitai для бенчмарків."""
+
+    daemon_threads = True
+
+    def __init__(self, total_images=200, image_size=100000, api_latency=0.05,
+                 image_latency=0.02, throttle_every=0, retry_after=0.5, port=0):
+        super().__init__(("127.0.0.1", port), MockCivitaiHandler)
+        self.total_images = total_images
+        self.api_latency = api_latency
+        self.image_latency = image_latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        # Спільне тіло з унікальним префіксом: різні хеші без зайвої пам'яті
+        self._payload = os.urandom(max(0, image_size - 16))
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v1/images"
+
+    def image_body(self, image_id):
+        return b"\x89PNG" + image_id.to_bytes(12, "big") + self._payload
+
+    def take_throttle(self):
+        with self._lock:
+            self.requests += 1
+            if self.throttle_every and self.requests % self.throttle_every == 0:
+                self.throttled += 1
+                return True
+            return False
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux повертає кілобайти, macOS - байти
+    return peak / (1048576 if sys.platform == "darwin" else 1024)
+
+
+def run_child(args):
+    # Один запуск конвеєра; результат - рядок JSON у stdout
+    from civitai_downloader.settings import DEFAULT_SETTINGS
+    from civitai_downloader.cli import build_options, close_options
+    from civitai_downloader.pipeline import DownloadPipeline
+
+    settings = dict(DEFAULT_SETTINGS, rate_limit=args.rate_limit, rate_burst=args.rate_burst,
+                    dedup=args.dedup, metrics_log=False, page_size=args.page_size)
+    options = build_options(settings, args.workers, args.folder)
+    metrics = options["metrics"]
+    pipeline = DownloadPipeline(
+        "", MODEL_ID, "", args.folder, image_limit=0,
+        base_url=args.base_url, log=lambda message: None, **options)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        stats = pipeline.run()
+    finally:
+        close_options(options, log=lambda message: None)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    summary = metrics.summary()
+    print(json.dumps({
+        "workers": args.workers,
+        "downloaded": stats["downloaded"],
+        "failed": stats["failed"],
+        "seconds": elapsed,
+        "images_per_second": stats["downloaded"] / elapsed if elapsed else 0,
+        "mb_per_second": stats["bytes"] / 1048576 / elapsed if elapsed else 0,
+        "peak_rss_mb": peak_rss_mb(),
+        "cpu_seconds": cpu,
+        "cpu_percent": 100 * cpu / elapsed if elapsed else 0,
+        "throttled": summary["counters"].get("throttled", 0),
+        "rate_limit_wait": summary["observations"].get("rate_limit_wait", {}).get("total", 0),
+    }))
+
+
+def run_benchmark(args, workers, server):
+    folder = tempfile.mkdtemp(prefix="civitai_bench_")
+    command = [sys.executable, os.path.abspath(__file__), "--child",
+               "--base-url", server.base_url, "--folder", folder,
+               "--workers", str(workers), "--page-size", str(args.page_size),
+               "--rate-limit", str(args.rate_limit), "--rate-burst", str(args.rate_burst)]
+    if not args.dedup:
+        command.append("--no-dedup")
+    try:
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def format_report(args, results):
+    lines = [
+        f"Зображень: {args.images} по {args.size} байт, сторінка {args.page_size}, "
+        f"затримка API {args.api_latency} с, CDN {args.image_latency} с, "
+        f"429 кожен {args.throttle_every or '-'}-й запит",
+        f"{'workers':>7} {'зобр.':>6} {'зобр/с':>8} {'МБ/с':>8} {'час, с':>8} {'RSS, МБ':>8} "
+        f"{'CPU, с':>7} {'CPU, %':>7} {'429':>5} {'помилок':>7}",
+    ]
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        lines.append(
+            f"{r['workers']:>7} {r['downloaded']:>6} {r['images_per_second']:>8.1f} {r['mb_per_second']:>8.2f} "
+            f"{r['seconds']:>8.2f} {rss:>8} {r['cpu_seconds']:>7.2f} {r['cpu_percent']:>7.1f} "
+            f"{r['throttled']:>5} {r['failed']:>7}")
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк завантажувача на локальному макеті Civitai.")
+    parser.add_argument("--images", type=int, default=200, help="кількість зображень на макеті")
+    parser.add_argument("--size", type=int, default=100000, help="розмір зображення, байт")
+    parser.add_argument("--page-size", type=int, default=100, help="зображень на сторінку API")
+    parser.add_argument("--workers", default="1,4,8",
+                        help="значення workers через кому, по запуску на кожне")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="затримка сторінки API, с")
+    parser.add_argument("--image-latency", type=float, default=0.02, help="затримка зображення, с")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="відповідати 429 на кожен N-й запит (0 - ніколи)")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After для 429, с")
+    parser.add_argument("--rate-limit", type=float, default=1000.0,
+                        help="rate_limit конвеєра; великий, щоб міряти сам конвеєр")
+    parser.add_argument("--rate-burst", type=int, default=100, help="rate_burst конвеєра")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false",
+                        help="зберігати файли без сховища за хешем")
+    parser.add_argument("--output", help="також записати звіт у файл")
+    # Внутрішні параметри дочірнього процесу
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        args.workers = int(args.workers)
+        run_child(args)
+        return 0
+
+    server = MockCivitaiServer(args.images, args.size, args.api_latency, args.image_latency,
+                               args.throttle_every, args.retry_after).start()
+    results = []
+    try:
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+            results.append(run_benchmark(args, workers, server))
+            print(f"workers={workers}: {results[-1]['images_per_second']:.1f} зобр/с", file=sys.stderr)
+    finally:
+        server.stop()
+
+    report = format_report(args, results)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
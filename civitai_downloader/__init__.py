@@ -0,0 +1,3 @@
+# Спільне ядро завантаження для gui.py та CIVIA_parser_V2.py.
+# Модулі імпортуються напряму (наприклад, civitai_downloader.pipeline),
+# щоб точки входу тягнули лише те, що їм потрібно.
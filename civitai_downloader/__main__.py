@@ -0,0 +1,7 @@
+import sys
+
+from civitai_downloader.cli import main
+
+# Захист потрібен процесам пулу перетворення зображень (spawn)
+if __name__ == "__main__":
+    sys.exit(main())
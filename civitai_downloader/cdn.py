@@ -0,0 +1,45 @@
+from urllib.parse import urlparse, urlunparse
+
+# Хости CDN Civitai, що підтримують сегменти перетворення в шляху
+CDN_HOSTS = ("image.civitai.com",)
+
+# Статуси, за яких варіант вважається недоступним і завантажується оригінал
+VARIANT_UNAVAILABLE_STATUSES = (400, 403, 404, 410)
+
+
+def _is_transform(segment):
+    # Сегмент перетворення: "width=450", "original=true", "width=450,quality=90"
+    return "=" in segment and all("=" in option for option in segment.split(","))
+
+
+def target_width(item, max_size):
+    """Ширина варіанта, за якої найбільша сторона не перевищує max_size.
+
+    Повертає None, якщо оригінал і так не більший за max_size.
+    """
+    width, height = item.get("width") or 0, item.get("height") or 0
+    if not width or not height:
+        return max_size
+    if max(width, height) <= max_size:
+        return None
+    return max(1, round(max_size * width / max(width, height)))
+
+
+def variant_url(url, width):
+    """Переписує URL зображення CDN на варіант шириною width.
+
+    Сегмент перетворення перед ім'ям файлу замінюється на "width=N" або
+    додається, якщо його немає. Ім'я файлу не змінюється. URL інших
+    хостів повертаються без змін.
+    """
+    parsed = urlparse(url)
+    if parsed.hostname not in CDN_HOSTS:
+        return url
+    segments = parsed.path.split("/")
+    if len(segments) < 3:
+        return url
+    if _is_transform(segments[-2]):
+        segments[-2] = f"width={width}"
+    else:
+        segments.insert(-1, f"width={width}")
+    return urlunparse(parsed._replace(path="/".join(segments)))
@@ -0,0 +1,54 @@
+import os
+import json
+import time
+
+CHECKPOINT_FILENAME = "civitai_checkpoint.json"
+
+
+class Checkpoint:
+    """Стан посторінкового обходу /api/v1/images для однієї моделі/версії.
+
+    Після кожної повністю обробленої сторінки на диск записуються параметри
+    запиту, курсор nextPage, кількість пройдених сторінок і зображень, що
+    вже зараховані в ліміт. У режимі продовження обхід починається з
+    збереженого курсора, тож уже оброблені сторінки повторно не
+    запитуються.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+
+    @classmethod
+    def for_model_dir(cls, model_dir):
+        return cls(os.path.join(model_dir, CHECKPOINT_FILENAME))
+
+    def load(self, params):
+        """Читає збережений стан, якщо він належить до запиту з тими самими params."""
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("params") != params:
+            return None
+        self.state = state
+        return state
+
+    def start(self, params):
+        self.state = {"params": params, "next_page": None, "pages_done": 0, "images": 0, "completed": False}
+        self._save()
+
+    def page_done(self, next_page, images=0):
+        self.state["next_page"] = next_page
+        self.state["pages_done"] = self.state.get("pages_done", 0) + 1
+        self.state["images"] = self.state.get("images", 0) + images
+        self.state["completed"] = not next_page
+        self._save()
+
+    def _save(self):
+        self.state["updated_at"] = time.time()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,473 @@
+"""Консольна точка входу без графічного інтерфейсу.
+
+    python -m civitai_downloader --folder /data/civitai --model-id 1022641 --version-id 1523537
+
+Модулі мережі та збереження імпортуються лише після розбору аргументів,
+тож --help і помилки аргументів працюють миттєво, а на серверах без
+дисплея не потрібні ні Tkinter, ні PyQt5.
+"""
+import os
+import sys
+import argparse
+
+from civitai_downloader.settings import SETTINGS_FILE, load_settings
+from civitai_downloader.filters import SORT_OPTIONS, PERIODS, FILTER_KEYS, ImageFilter
+
+NSFW_LEVELS = ("none", "Soft", "Mature", "X")
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"значення не може бути від'ємним: {value}")
+    return number
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="civitai_downloader",
+        description="Завантаження зображень і підказок з Civitai без графічного інтерфейсу.")
+    parser.add_argument("-o", "--folder", required=True,
+                        help="папка для завантаження")
+    parser.add_argument("-m", "--model-id",
+                        help="ID моделі")
+    parser.add_argument("-v", "--version-id", default="",
+                        help="ID версії моделі (необов'язково)")
+    parser.add_argument("--jobs", metavar="FILE",
+                        help="файл зі списком завдань modelId[:versionId] для пакетного режиму")
+    parser.add_argument("--nsfw", choices=NSFW_LEVELS,
+                        help="рівень NSFW (за замовчуванням з налаштувань)")
+    parser.add_argument("--limit", type=non_negative_int,
+                        help="загальна кількість зображень моделі/версії (0 - без обмеження)")
+    parser.add_argument("--page-size", type=int,
+                        help="кількість зображень на сторінку API (до 200)")
+    parser.add_argument("--image-size", type=int, metavar="PX",
+                        help="запитувати з CDN зменшений варіант з такою найбільшою стороною")
+    parser.add_argument("--sort", choices=SORT_OPTIONS,
+                        help="порядок зображень в API")
+    parser.add_argument("--period", choices=PERIODS,
+                        help="період API для сортування")
+
+    filters = parser.add_argument_group("фільтри", "перевіряються до завантаження кожного зображення")
+    filters.add_argument("--min-width", type=int, help="мінімальна ширина, px")
+    filters.add_argument("--min-height", type=int, help="мінімальна висота, px")
+    filters.add_argument("--min-reactions", type=int, help="мінімальна кількість реакцій")
+    filters.add_argument("--nsfw-levels", help="дозволені рівні NSFW через кому, наприклад None,Soft")
+    filters.add_argument("--after", dest="created_after", metavar="DATE",
+                         help="створені не раніше дати ISO, наприклад 2024-01-31")
+    filters.add_argument("--before", dest="created_before", metavar="DATE",
+                         help="створені раніше дати ISO")
+    filters.add_argument("--include", help="слова в підказці через кому (хоча б одне)")
+    filters.add_argument("--exclude", help="слова в підказці через кому (жодного)")
+    filters.add_argument("--media-type", dest="media_types", help="типи медіа через кому: image, video")
+    parser.add_argument("-j", "--workers", type=int,
+                        help="кількість одночасних завантажень")
+    parser.add_argument("--parallel-jobs", type=int,
+                        help="кількість одночасних завдань у пакетному режимі")
+    parser.add_argument("--resume", action="store_true",
+                        help="продовжити з останньої збереженої сторінки")
+    parser.add_argument("--sync", action=argparse.BooleanOptionalAction,
+                        help="лише нові зображення з часу останньої синхронізації (сортування Newest); "
+                             "--no-sync вимикає синхронізацію з налаштувань")
+    parser.add_argument("--output", choices=("files", "shards"),
+                        help="окремі файли або tar-шарди WebDataset")
+    parser.add_argument("--shard-size", type=int, metavar="MB",
+                        help="максимальний розмір шарду, МБ")
+    parser.add_argument("--transcode", choices=("webp", "jpeg", "png"),
+                        help="перетворювати завантажені зображення в цей формат (потрібен Pillow)")
+    parser.add_argument("--quality", type=int, help="якість перетворення, 1-100")
+    parser.add_argument("--max-size", type=int, metavar="PX",
+                        help="найбільша сторона перетвореного або зменшеного зображення (працює і без --transcode)")
+    parser.add_argument("--thumbnail", type=int, metavar="PX",
+                        help="створювати мініатюри з такою найбільшою стороною")
+    parser.add_argument("--plan", nargs="?", const="", metavar="FILE",
+                        help="лише оцінити кількість, обсяг і час без завантаження зображень "
+                             "і зберегти маніфест (за замовчуванням civitai_plan.json у папці)")
+    parser.add_argument("--plan-head", action="store_true",
+                        help="у режимі --plan дізнаватись розміри зображень HEAD-запитами")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="завантажити зображення з маніфесту --plan без обходу API")
+    parser.add_argument("--verify", action="store_true",
+                        help="перевірити цілісність завантажених файлів (без --model-id - усієї папки)")
+    parser.add_argument("--repair", action="store_true",
+                        help="перевірити і завантажити пошкоджені файли повторно")
+    parser.add_argument("--verify-quick", action="store_true",
+                        help="перевіряти лише розмір, заголовок і кінець файлу, без SHA-256 і декодування")
+    parser.add_argument("--verify-remote", action="store_true",
+                        help="звіряти розмір файлів без хешу в індексі з Content-Length сервера")
+    parser.add_argument("--ledger", metavar="FILE",
+                        help="спільний реєстр роботи для кількох вузлів: з --model-id/--jobs додати "
+                             "завдання, з --worker виконувати їх, без них - показати стан")
+    parser.add_argument("--worker", nargs="?", const="", metavar="NAME",
+                        help="працювати вузлом реєстру --ledger (ім'я за замовчуванням хост:pid)")
+    parser.add_argument("--lease-ttl", type=int, metavar="SEC",
+                        help="тривалість оренди одиниці роботи, після якої її забирає інший вузол")
+    parser.add_argument("--rate-limit", type=float, metavar="RPS",
+                        help="запитів на секунду для цього процесу (за замовчуванням з налаштувань)")
+    parser.add_argument("--no-prompt-files", action="store_true",
+                        help="не створювати .txt з підказками (метадані лишаються в civitai_metadata.jsonl)")
+    parser.add_argument("--export-prompts", action="store_true",
+                        help="лише створити .txt з підказками з civitai_metadata.jsonl моделі/версії")
+    parser.add_argument("--no-page-cache", action="store_true",
+                        help="не використовувати кеш сторінок API")
+    parser.add_argument("--no-metrics-log", action="store_true",
+                        help="не писати журнал метрик civitai_metrics.jsonl")
+    parser.add_argument("--api-key",
+                        help="API ключ (або змінна середовища CIVITAI_API_KEY)")
+    parser.add_argument("--settings", default=SETTINGS_FILE,
+                        help="файл налаштувань (за замовчуванням civitai_settings.json)")
+    return parser
+
+
+def build_options(settings, workers, download_folder, parallel_jobs=1):
+    # Спільні ресурси конвеєра: HTTP-сесія, обмежувач швидкості та метрики
+    from civitai_downloader.ratelimit import RateLimiter
+    from civitai_downloader.session import create_session
+    from civitai_downloader.metrics import Metrics
+    from civitai_downloader.transcode import Transcoder
+    from civitai_downloader.page_cache import PageCache
+
+    session = create_session(
+        pool_maxsize=settings["pool_maxsize"] or workers + parallel_jobs,
+        retries=settings["http_retries"], backoff_factor=settings["http_backoff"])
+    page_cache = None
+    if settings["page_cache_ttl"]:
+        page_cache = PageCache.for_folder(download_folder, settings["page_cache_ttl"],
+                                          settings["page_cache_mb"] * 1048576)
+    return dict(
+        workers=workers,
+        rate_limiter=RateLimiter(settings["rate_limit"], settings["rate_burst"]),
+        prefetch_pages=settings["prefetch_pages"],
+        page_size=settings["page_size"],
+        dedup=settings["dedup"],
+        link_mode=settings["link_mode"],
+        prompt_files=settings["prompt_files"],
+        sort=settings["sort"],
+        period=settings["period"],
+        image_filter=ImageFilter.from_dict(settings["filters"]),
+        output=settings["output"],
+        sync=settings["sync"],
+        max_image_size=settings["max_image_size"],
+        page_cache=page_cache,
+        timeout=settings["http_timeout"],
+        transcoder=Transcoder.from_dict(settings["transcode"]),
+        shard_size=settings["shard_size_mb"] * 1048576,
+        metrics=Metrics.for_folder(download_folder) if settings["metrics_log"] else Metrics(),
+        session=session)
+
+
+def close_options(options, log, cancel=False):
+    options["session"].close()
+    if options["page_cache"] is not None:
+        options["page_cache"].close()
+    if options["transcoder"] is not None:
+        # Після переривання черга перетворень не доробляється
+        options["transcoder"].close(cancel=cancel)
+    metrics = options["metrics"]
+    metrics.close()
+    for line in metrics.format_summary():
+        log(line)
+
+
+def run_single(api_key, model_id, model_version_id, download_folder, settings,
+               workers=4, image_limit=100, nsfw='X', resume=False, log=print):
+    from civitai_downloader.pipeline import DownloadPipeline
+
+    options = build_options(settings, workers, download_folder)
+    pipeline = DownloadPipeline(
+        api_key, model_id, model_version_id, download_folder,
+        image_limit=image_limit, nsfw=nsfw, resume=resume, log=log, **options)
+    completed = False
+    try:
+        stats = pipeline.run()
+        completed = True
+        return stats
+    finally:
+        close_options(options, log, cancel=not completed)
+
+
+def run_batch(api_key, jobs, download_folder, settings, workers=4, parallel_jobs=2,
+              image_limit=100, nsfw='X', resume=False, log=print):
+    from civitai_downloader.jobs import JobQueue, BatchRunner
+
+    options = build_options(settings, workers, download_folder, parallel_jobs)
+    job_queue = JobQueue.for_folder(download_folder)
+    job_queue.add_many(jobs)
+    runner = BatchRunner(
+        job_queue, api_key, download_folder, parallel_jobs=parallel_jobs,
+        image_limit=image_limit, nsfw=nsfw, resume=resume, log=log, **options)
+    completed = False
+    try:
+        stats = runner.run()
+        completed = True
+        return stats
+    finally:
+        close_options(options, log, cancel=not completed)
+
+
+def run_plan(api_key, jobs, download_folder, settings, manifest_path=None, head=False,
+             workers=4, image_limit=100, nsfw='X', resume=False, log=print):
+    from civitai_downloader.pipeline import DownloadPipeline
+    from civitai_downloader.index import DownloadIndex
+    from civitai_downloader.planner import (PLAN_FILENAME, DownloadPlanner, build_manifest,
+                                            format_report, write_manifest)
+
+    options = build_options(settings, workers, download_folder)
+    # Перетворення нічого не отримає, тож пул процесів не потрібен
+    if options["transcoder"] is not None:
+        options["transcoder"].close()
+        options["transcoder"] = None
+    index = DownloadIndex.for_folder(download_folder)
+    completed = False
+    try:
+        planned = []
+        for model_id, model_version_id in jobs:
+            pipeline = DownloadPipeline(
+                api_key, model_id, model_version_id, download_folder, image_limit=image_limit,
+                nsfw=nsfw, index=index, log=log, **options)
+            planned.append(DownloadPlanner(pipeline, head=head).run())
+        manifest = build_manifest(planned, download_folder, options["rate_limiter"], index.average_size())
+        completed = True
+    finally:
+        index.close()
+        close_options(options, log, cancel=not completed)
+
+    for line in format_report(manifest):
+        log(line)
+    manifest_path = manifest_path or os.path.join(download_folder, PLAN_FILENAME)
+    write_manifest(manifest, manifest_path)
+    log(f"Маніфест збережено: {manifest_path}")
+    return manifest
+
+
+def run_manifest(api_key, manifest_path, download_folder, settings,
+                 workers=4, image_limit=100, nsfw='X', resume=False, log=print):
+    from civitai_downloader.pipeline import DownloadPipeline
+    from civitai_downloader.index import DownloadIndex
+    from civitai_downloader.planner import load_manifest
+
+    manifest = load_manifest(manifest_path)
+    options = build_options(settings, workers, download_folder)
+    # Позначку синхронізації зсуває лише обхід API
+    options["sync"] = False
+    index = DownloadIndex.for_folder(download_folder)
+    stats = {}
+    completed = False
+    try:
+        for number, job in enumerate(manifest["jobs"], 1):
+            log(f"Маніфест, завдання {number}/{len(manifest['jobs'])}: модель {job['model_id']}"
+                + (f"/{job['model_version_id']}" if job["model_version_id"] else ""))
+            pipeline = DownloadPipeline(
+                api_key, job["model_id"], job["model_version_id"], download_folder,
+                # Ліміт уже врахований під час складання маніфесту
+                image_limit=0, nsfw=nsfw, index=index, log=log,
+                planned_items=job["items"], **dict(options, output=job.get("output", options["output"])))
+            for key, value in pipeline.run().items():
+                stats[key] = stats.get(key, 0) + value
+        completed = True
+        return stats
+    finally:
+        index.close()
+        close_options(options, log, cancel=not completed)
+
+
+def run_verify(api_key, download_folder, settings, model_id=None, model_version_id="",
+               repair=False, quick=False, remote=False, workers=4, nsfw='X', log=print):
+    # Повертає кількість файлів, що лишились пошкодженими
+    from civitai_downloader.index import DownloadIndex
+    from civitai_downloader.ratelimit import RateLimiter
+    from civitai_downloader.session import create_session
+    from civitai_downloader.verify import REPAIR_FILENAME, Verifier
+    from civitai_downloader.planner import build_manifest, write_manifest
+
+    index = DownloadIndex.for_folder(download_folder)
+    session = create_session(pool_maxsize=8) if remote else None
+    rate_limiter = RateLimiter(settings["rate_limit"], settings["rate_burst"])
+    try:
+        verifier = Verifier(download_folder, index, full=not quick, log=log,
+                            session=session, rate_limiter=rate_limiter, timeout=settings["http_timeout"])
+        entries = verifier.entries(model_id, model_version_id)
+        log(f"Файлів для перевірки: {len(entries)}")
+        if remote:
+            log(f"Розмір з сервера для записів без хешу: {verifier.remote_sizes(entries)}")
+        broken = verifier.run(entries)
+        for line in verifier.format_summary(entries, broken):
+            log(line)
+        if not repair:
+            return len(broken)
+        jobs = verifier.repair(broken)
+    finally:
+        index.close()
+        if session is not None:
+            session.close()
+
+    # Файли поза індексом лише показуються у звіті
+    unindexed = sum(entry["id"] is None for entry in broken)
+    if not jobs:
+        return unindexed
+    manifest_path = os.path.join(download_folder, REPAIR_FILENAME)
+    write_manifest(build_manifest(jobs, download_folder, rate_limiter), manifest_path)
+    log(f"Повторне завантаження: {sum(len(job['items']) for job in jobs)} файлів, маніфест {manifest_path}")
+    stats = run_manifest(api_key, manifest_path, download_folder, settings,
+                         workers=workers, nsfw=nsfw, log=log)
+    return unindexed + stats["failed"]
+
+
+def run_ledger_jobs(jobs, ledger_path, settings, image_limit=100, nsfw='X', log=print):
+    # Координатор лише записує завдання в реєстр; роботу виконують вузли
+    from civitai_downloader.ledger import Ledger
+
+    ledger = Ledger(ledger_path)
+    try:
+        options = dict(nsfw=nsfw, sort=settings["sort"], period=settings["period"],
+                       filters=settings["filters"], image_limit=image_limit, page_size=settings["page_size"])
+        for model_id, model_version_id in jobs:
+            label = model_id + (f"/{model_version_id}" if model_version_id else "")
+            if ledger.add_job(model_id, model_version_id, options):
+                log(f"Завдання {label} додано в реєстр")
+            else:
+                log(f"Завдання {label} уже виконується")
+        log_ledger_summary(ledger, log)
+    finally:
+        ledger.close()
+
+
+def log_ledger_summary(ledger, log):
+    summary = ledger.summary()
+    log(f"Реєстр: завдань {summary['jobs']}, зображень у лімітах {summary['admitted']}; одиниць роботи: "
+        f"в черзі {summary['pending']}, в оренді {summary['leased']}, виконано {summary['done']}, "
+        f"невдалих {summary['failed']}")
+
+
+def run_worker(api_key, ledger_path, download_folder, settings, name=None, workers=4, log=print):
+    # Ліміт, NSFW і фільтри кожного завдання записані в реєстрі координатором
+    from civitai_downloader.ledger import Ledger, LedgerWorker
+
+    ledger = Ledger(ledger_path)
+    options = build_options(settings, workers, download_folder)
+    worker = LedgerWorker(ledger, api_key, download_folder, name=name or None,
+                          lease_ttl=settings["lease_ttl"], log=log, **options)
+    completed = False
+    try:
+        stats = worker.run()
+        completed = True
+        log(f"Вузол {worker.name}: сторінок {stats['pages']}, пакетів {stats['batches']}")
+        return stats
+    finally:
+        close_options(options, log, cancel=not completed)
+        ledger.close()
+
+
+def export_prompts(download_folder, model_id, model_version_id):
+    from civitai_downloader.metadata import MetadataStore
+
+    model_dir = os.path.join(download_folder, model_id, model_version_id)
+    count = MetadataStore.for_model_dir(model_dir).export_prompts()
+    print(f"Створено файлів з підказками: {count}")
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if (not args.model_id and not args.jobs and not args.manifest and not args.verify and not args.repair
+            and not args.ledger):
+        parser.error("потрібно вказати --model-id, --jobs, --manifest, --verify, --repair або --ledger")
+    if args.worker is not None and not args.ledger:
+        parser.error("--worker потребує --ledger")
+    if args.model_id and not args.model_id.isdigit():
+        parser.error("--model-id має бути числом")
+    if args.version_id and not args.version_id.isdigit():
+        parser.error("--version-id має бути числом")
+
+    if args.export_prompts:
+        if not args.model_id:
+            parser.error("--export-prompts потребує --model-id")
+        return export_prompts(args.folder, args.model_id, args.version_id)
+
+    settings = load_settings(args.settings)
+    if args.no_metrics_log:
+        settings["metrics_log"] = False
+    if args.no_page_cache:
+        settings["page_cache_ttl"] = 0
+    if args.no_prompt_files:
+        settings["prompt_files"] = False
+    settings["page_size"] = args.page_size or settings["page_size"]
+    settings["rate_limit"] = args.rate_limit or settings["rate_limit"]
+    settings["lease_ttl"] = args.lease_ttl or settings["lease_ttl"]
+    settings["sort"] = args.sort or settings["sort"]
+    if args.sync is not None:
+        settings["sync"] = args.sync
+    settings["max_image_size"] = args.image_size or settings["max_image_size"]
+    transcode = {"format": args.transcode, "quality": args.quality,
+                 "max_size": args.max_size, "thumbnail_size": args.thumbnail}
+    settings["transcode"] = dict(settings["transcode"], **{
+        key: value for key, value in transcode.items() if value is not None})
+    settings["output"] = args.output or settings["output"]
+    settings["shard_size_mb"] = args.shard_size or settings["shard_size_mb"]
+    settings["period"] = args.period or settings["period"]
+    # Правила з командного рядка доповнюють правила з налаштувань
+    settings["filters"] = dict(settings["filters"], **{
+        key: getattr(args, key) for key in FILTER_KEYS if getattr(args, key) is not None})
+    api_key = args.api_key or os.environ.get("CIVITAI_API_KEY") or settings["api_key"]
+    common = dict(
+        workers=args.workers or settings["workers"],
+        image_limit=args.limit if args.limit is not None else settings["image_limit"],
+        nsfw=args.nsfw or settings["nsfw"],
+        resume=args.resume)
+
+    try:
+        if args.verify or args.repair:
+            broken = run_verify(api_key, args.folder, settings, args.model_id, args.version_id,
+                                repair=args.repair, quick=args.verify_quick,
+                                remote=args.verify_remote, workers=common["workers"], nsfw=common["nsfw"])
+            return 1 if broken else 0
+        if args.ledger and args.worker is not None:
+            stats = run_worker(api_key, args.ledger, args.folder, settings, name=args.worker,
+                               workers=common["workers"])
+        elif args.ledger:
+            if not args.model_id and not args.jobs:
+                from civitai_downloader.ledger import Ledger
+                ledger = Ledger(args.ledger)
+                try:
+                    log_ledger_summary(ledger, print)
+                finally:
+                    ledger.close()
+                return 0
+            jobs = [(args.model_id, args.version_id)]
+            if args.jobs:
+                from civitai_downloader.jobs import parse_job_list
+                with open(args.jobs, "r", encoding="utf-8") as jobs_file:
+                    jobs = parse_job_list(jobs_file.read())
+            run_ledger_jobs(jobs, args.ledger, settings, image_limit=common["image_limit"], nsfw=common["nsfw"])
+            return 0
+        elif args.manifest:
+            stats = run_manifest(api_key, args.manifest, args.folder, settings, **common)
+        elif args.plan is not None:
+            jobs = [(args.model_id, args.version_id)]
+            if args.jobs:
+                from civitai_downloader.jobs import parse_job_list
+                with open(args.jobs, "r", encoding="utf-8") as jobs_file:
+                    jobs = parse_job_list(jobs_file.read())
+            run_plan(api_key, jobs, args.folder, settings, manifest_path=args.plan or None,
+                     head=args.plan_head or settings["plan_head"], **common)
+            return 0
+        elif args.jobs:
+            from civitai_downloader.jobs import parse_job_list
+            with open(args.jobs, "r", encoding="utf-8") as jobs_file:
+                jobs = parse_job_list(jobs_file.read())
+            stats = run_batch(api_key, jobs, args.folder, settings,
+                              parallel_jobs=args.parallel_jobs or settings["parallel_jobs"], **common)
+        else:
+            stats = run_single(api_key, args.model_id, args.version_id, args.folder, settings, **common)
+    except KeyboardInterrupt:
+        print("Завантаження перервано.", file=sys.stderr)
+        return 130
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Помилка: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Завантажено: {stats['downloaded']}, пропущено: {stats['skipped']}, "
+          f"пов'язано: {stats['linked']}, відфільтровано: {stats.get('filtered', 0)}, "
+          f"помилок: {stats['failed']}")
+    return 0
@@ -0,0 +1,80 @@
+import os
+import shutil
+
+STORE_DIRNAME = ".store"
+
+# ioctl FICLONE з linux/fs.h: копія файлу зі спільними блоками (btrfs, xfs)
+FICLONE = 0x40049409
+
+LINK_MODES = ("hardlink", "reflink", "copy")
+
+
+def reflink(source, dest):
+    import fcntl  # Лише Unix
+    with open(source, "rb") as src, open(dest, "xb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(dest)
+            raise
+
+
+class ContentStore:
+    """Сховище зображень, адресоване за SHA-256 вмісту.
+
+    Кожне зображення зберігається один раз як .store/<sha[:2]>/<sha><ext>,
+    а в папки моделей/версій потрапляє жорстким посиланням (або reflink чи,
+    в крайньому разі, копією, якщо файлова система посилань не підтримує).
+    Однакові зображення з кількох моделей займають місце на диску один раз.
+    """
+
+    def __init__(self, root, link_mode="hardlink"):
+        self.root = root
+        # Спочатку бажаний спосіб, далі решта як запасні варіанти
+        self.link_modes = (link_mode,) + tuple(m for m in LINK_MODES if m != link_mode)
+
+    @classmethod
+    def for_folder(cls, download_folder, link_mode="hardlink"):
+        return cls(os.path.join(download_folder, STORE_DIRNAME), link_mode)
+
+    def blob_path(self, sha256, ext=""):
+        return os.path.join(self.root, sha256[:2], sha256 + ext.lower())
+
+    def import_file(self, source, sha256, dest):
+        """Переносить source у сховище і створює посилання dest на нього.
+
+        Якщо такий вміст уже є у сховищі, source видаляється. Повертає True,
+        коли вміст виявився дублікатом.
+        """
+        blob = self.blob_path(sha256, os.path.splitext(dest)[1])
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        duplicate = os.path.exists(blob)
+        if duplicate:
+            os.remove(source)
+        else:
+            os.replace(source, blob)
+        self.link(blob, dest)
+        return duplicate
+
+    def link(self, source, dest):
+        temp_dest = dest + ".link"
+        # Залишок перерваного попереднього запуску
+        if os.path.lexists(temp_dest):
+            os.remove(temp_dest)
+        last_error = None
+        for mode in self.link_modes:
+            try:
+                if mode == "hardlink":
+                    os.link(source, temp_dest)
+                elif mode == "reflink":
+                    reflink(source, temp_dest)
+                else:
+                    shutil.copyfile(source, temp_dest)
+            except (OSError, ImportError) as e:
+                last_error = e
+                continue
+            # Як і для звичайних завантажень, кінцеве ім'я з'являється атомарно
+            os.replace(temp_dest, dest)
+            return mode
+        raise last_error
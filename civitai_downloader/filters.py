@@ -0,0 +1,74 @@
+SORT_OPTIONS = ("Most Reactions", "Most Comments", "Newest")
+PERIODS = ("AllTime", "Year", "Month", "Week", "Day")
+
+# Реакції з item["stats"], що рахуються для min_reactions
+REACTION_KEYS = ("likeCount", "heartCount", "laughCount", "cryCount")
+
+FILTER_KEYS = ("min_width", "min_height", "min_reactions", "nsfw_levels",
+               "created_after", "created_before", "include", "exclude", "media_types")
+
+
+def _words(value):
+    # Список слів з рядка через кому або зі списку
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(word.strip().lower() for word in value or () if word.strip())
+
+
+class ImageFilter:
+    """Правила відбору елементів API до завантаження зображення.
+
+    Перевіряються мінімальні ширина та висота, кількість реакцій, рівень
+    NSFW, дата створення (рядки ISO, created_after включно, created_before -
+    ні), ключові слова в підказці (include - хоча б одне, exclude - жодного)
+    і тип медіа (image, video). Елемент без потрібного поля правило не
+    проходить. Те, що API вміє фільтрувати сам (sort, period, nsfw),
+    передається параметрами запиту в DownloadPipeline.build_params.
+    """
+
+    def __init__(self, min_width=0, min_height=0, min_reactions=0, nsfw_levels=(),
+                 created_after=None, created_before=None, include=(), exclude=(), media_types=()):
+        self.min_width = int(min_width or 0)
+        self.min_height = int(min_height or 0)
+        self.min_reactions = int(min_reactions or 0)
+        self.nsfw_levels = {level.lower() for level in _words(nsfw_levels)}
+        self.created_after = created_after or None
+        self.created_before = created_before or None
+        self.include = _words(include)
+        self.exclude = _words(exclude)
+        self.media_types = set(_words(media_types))
+
+    @classmethod
+    def from_dict(cls, rules):
+        unknown = set(rules or {}) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Невідомі правила фільтра: {', '.join(sorted(unknown))}")
+        return cls(**(rules or {}))
+
+    def rejects(self, item):
+        """Повертає причину відмови або None, якщо елемент проходить фільтр."""
+        if self.min_width and (item.get("width") or 0) < self.min_width:
+            return "width"
+        if self.min_height and (item.get("height") or 0) < self.min_height:
+            return "height"
+        if self.min_reactions:
+            stats = item.get("stats") or {}
+            if sum(stats.get(key) or 0 for key in REACTION_KEYS) < self.min_reactions:
+                return "reactions"
+        if self.nsfw_levels and str(item.get("nsfwLevel", "")).lower() not in self.nsfw_levels:
+            return "nsfw"
+        # Дати ISO 8601 в UTC порівнюються як рядки
+        created = item.get("createdAt") or ""
+        if self.created_after and created < self.created_after:
+            return "created_after"
+        if self.created_before and (not created or created >= self.created_before):
+            return "created_before"
+        if self.include or self.exclude:
+            prompt = str((item.get("meta") or {}).get("prompt") or "").lower()
+            if self.include and not any(word in prompt for word in self.include):
+                return "include"
+            if any(word in prompt for word in self.exclude):
+                return "exclude"
+        if self.media_types and str(item.get("type", "")).lower() not in self.media_types:
+            return "media_type"
+        return None
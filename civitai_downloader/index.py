@@ -0,0 +1,191 @@
+import os
+import time
+import sqlite3
+import threading
+
+INDEX_FILENAME = "civitai_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    sha256 TEXT,
+    model_id TEXT,
+    model_version_id TEXT,
+    downloaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_model ON images (model_id, model_version_id);
+CREATE TABLE IF NOT EXISTS placements (
+    image_id INTEGER NOT NULL,
+    model_id TEXT NOT NULL,
+    model_version_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (image_id, model_id, model_version_id)
+);
+CREATE TABLE IF NOT EXISTS sync_marks (
+    model_id TEXT NOT NULL,
+    model_version_id TEXT NOT NULL,
+    image_id INTEGER,
+    created_at TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (model_id, model_version_id)
+);
+"""
+
+# Індекси, створені до появи таблиці placements: кожне зображення вже
+# розміщене в папці своєї моделі/версії
+MIGRATE_PLACEMENTS = """
+INSERT OR IGNORE INTO placements (image_id, model_id, model_version_id, path)
+SELECT id, COALESCE(model_id, ''), COALESCE(model_version_id, ''), path FROM images
+"""
+
+IMAGE_COLUMNS = ("id", "url", "path", "size", "sha256", "model_id", "model_version_id", "downloaded_at")
+
+# Обмеження SQLite на кількість параметрів в одному запиті
+MAX_QUERY_PARAMS = 500
+
+
+class DownloadIndex:
+    """Індекс завантажених зображень у SQLite (режим WAL).
+
+    Ключ - id зображення Civitai. Конвеєр перевіряє цілу сторінку API одним
+    запитом і пропускає відомі зображення ще до звернення до мережі чи
+    файлової системи. Таблиця placements пам'ятає, в які папки моделей/версій
+    уже покладено кожне зображення, а sync_marks - найновіше зображення
+    останньої повної синхронізації моделі/версії. Один екземпляр безпечно
+    використовувати з кількох потоків.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        has_placements = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'placements'").fetchone()
+        self._conn.executescript(SCHEMA)
+        if not has_placements:
+            with self._conn:
+                self._conn.execute(MIGRATE_PLACEMENTS)
+
+    @classmethod
+    def for_folder(cls, download_folder):
+        os.makedirs(download_folder, exist_ok=True)
+        return cls(os.path.join(download_folder, INDEX_FILENAME))
+
+    def _select_in(self, query, image_ids, extra=()):
+        # Запит з "IN (...)" частинами, щоб не перевищити ліміт параметрів
+        image_ids = [int(i) for i in image_ids]
+        rows = []
+        with self._lock:
+            for start in range(0, len(image_ids), MAX_QUERY_PARAMS):
+                batch = image_ids[start:start + MAX_QUERY_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._conn.execute(query.format(placeholders), list(extra) + batch))
+        return rows
+
+    def known_ids(self, image_ids, model_id=None, model_version_id=None):
+        """Повертає підмножину image_ids, які вже є в індексі.
+
+        Якщо вказано model_id, враховуються лише зображення, вже розміщені
+        в папці цієї моделі/версії.
+        """
+        if model_id is None:
+            rows = self._select_in("SELECT id FROM images WHERE id IN ({})", image_ids)
+        else:
+            rows = self._select_in(
+                "SELECT image_id FROM placements WHERE model_id = ? AND model_version_id = ? "
+                "AND image_id IN ({})", image_ids, (str(model_id), str(model_version_id or "")))
+        return {row[0] for row in rows}
+
+    def records(self, image_ids):
+        """Повертає словник id -> запис для відомих зображень з image_ids."""
+        rows = self._select_in(
+            f"SELECT {', '.join(IMAGE_COLUMNS)} FROM images WHERE id IN ({{}})", image_ids)
+        return {row[0]: dict(zip(IMAGE_COLUMNS, row)) for row in rows}
+
+    def add(self, image_id, url, path, size=None, sha256=None, model_id=None, model_version_id=None):
+        # Перший запис зображення лишається основним (шлях і модель), повторне
+        # завантаження оновлює лише URL, розмір і хеш
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO images "
+                "(id, url, path, size, sha256, model_id, model_version_id, downloaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET url = excluded.url, size = excluded.size, "
+                "sha256 = COALESCE(excluded.sha256, sha256), downloaded_at = excluded.downloaded_at",
+                (int(image_id), url, path, size, sha256,
+                 str(model_id) if model_id else None,
+                 str(model_version_id) if model_version_id else None,
+                 time.time()))
+            self._add_placement(image_id, model_id, model_version_id, path)
+
+    def add_placement(self, image_id, model_id, model_version_id, path):
+        with self._lock, self._conn:
+            self._add_placement(image_id, model_id, model_version_id, path)
+
+    def _add_placement(self, image_id, model_id, model_version_id, path):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO placements (image_id, model_id, model_version_id, path) "
+            "VALUES (?, ?, ?, ?)",
+            (int(image_id), str(model_id or ""), str(model_version_id or ""), path))
+
+    def placements(self, model_id=None, model_version_id=None):
+        """Повертає розміщення зображень разом з URL, розміром і хешем з images.
+
+        Якщо вказано model_id, лише розміщення цієї моделі/версії.
+        """
+        query = ("SELECT p.image_id, p.model_id, p.model_version_id, p.path, i.url, i.size, i.sha256 "
+                 "FROM placements p LEFT JOIN images i ON i.id = p.image_id")
+        args = ()
+        if model_id is not None:
+            query += " WHERE p.model_id = ? AND p.model_version_id = ?"
+            args = (str(model_id), str(model_version_id or ""))
+        columns = ("id", "model_id", "model_version_id", "path", "url", "size", "sha256")
+        with self._lock:
+            return [dict(zip(columns, row)) for row in self._conn.execute(query, args)]
+
+    def forget(self, image_id, model_id, model_version_id):
+        # Видаляється лише розміщення цієї моделі/версії, тож наступний запуск
+        # завантажить зображення знову. Запис зображення (URL, розмір, хеш)
+        # лишається, поки є інші розміщення, і основним шляхом стає одне з них
+        image_id = int(image_id)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM placements WHERE image_id = ? AND model_id = ? AND model_version_id = ?",
+                (image_id, str(model_id or ""), str(model_version_id or "")))
+            remaining = self._conn.execute(
+                "SELECT path FROM placements WHERE image_id = ? ORDER BY rowid LIMIT 1", (image_id,)).fetchone()
+            if remaining is None:
+                self._conn.execute("DELETE FROM images WHERE id = ?", (image_id,))
+            else:
+                self._conn.execute(
+                    "UPDATE images SET path = ? WHERE id = ? AND path NOT IN "
+                    "(SELECT path FROM placements WHERE image_id = ?)", (remaining[0], image_id, image_id))
+
+    def average_size(self):
+        """Середній розмір завантажених зображень у байтах або None."""
+        with self._lock:
+            return self._conn.execute("SELECT AVG(size) FROM images WHERE size > 0").fetchone()[0]
+
+    def sync_mark(self, model_id, model_version_id):
+        """Повертає (image_id, created_at) останньої синхронізації або None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT image_id, created_at FROM sync_marks WHERE model_id = ? AND model_version_id = ?",
+                (str(model_id), str(model_version_id or ""))).fetchone()
+
+    def set_sync_mark(self, model_id, model_version_id, image_id, created_at):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_marks "
+                "(model_id, model_version_id, image_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (str(model_id), str(model_version_id or ""),
+                 int(image_id) if image_id is not None else None, created_at, time.time()))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
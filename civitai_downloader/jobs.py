@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from civitai_downloader.pipeline import DownloadPipeline
+from civitai_downloader.index import DownloadIndex
+from civitai_downloader.ratelimit import RateLimiter
+from civitai_downloader.session import create_session
+
+JOBS_FILENAME = "civitai_jobs.json"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def parse_job_list(text):
+    """Розбирає список завдань: по одному на рядок або через кому.
+
+    Кожне завдання - "modelId", "modelId:versionId" або "modelId versionId".
+    Порожні рядки та коментарі після # ігноруються. Повертає список пар
+    (model_id, model_version_id) з рядковими значеннями.
+    """
+    jobs = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        for entry in line.split(","):
+            parts = [p for p in re.split(r"[\s:/]+", entry.strip()) if p]
+            if not parts:
+                continue
+            if len(parts) > 2 or not all(p.isdigit() for p in parts):
+                raise ValueError(f"Некоректне завдання: {entry.strip()}")
+            jobs.append((parts[0], parts[1] if len(parts) > 1 else ""))
+    return jobs
+
+
+def job_label(job):
+    if job["model_version_id"]:
+        return f"{job['model_id']}/{job['model_version_id']}"
+    return job["model_id"]
+
+
+class JobQueue:
+    """Черга пакетних завдань (пар модель/версія), збережена у JSON.
+
+    Стан кожного завдання записується на диск при кожній зміні, тож після
+    перезапуску незавершені завдання виконуються знову, а перервані під
+    час роботи - продовжуються з чекпойнту.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.jobs = []
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f).get("jobs", [])
+
+    @classmethod
+    def for_folder(cls, download_folder):
+        os.makedirs(download_folder, exist_ok=True)
+        return cls(os.path.join(download_folder, JOBS_FILENAME))
+
+    def _find(self, model_id, model_version_id):
+        for job in self.jobs:
+            if job["model_id"] == model_id and job["model_version_id"] == model_version_id:
+                return job
+        return None
+
+    def add(self, model_id, model_version_id=""):
+        model_id, model_version_id = str(model_id), str(model_version_id or "")
+        with self._lock:
+            job = self._find(model_id, model_version_id)
+            if job is None:
+                job = {"model_id": model_id, "model_version_id": model_version_id}
+                self.jobs.append(job)
+            if job.get("status") != RUNNING:
+                # Завершене завдання при повторному додаванні стає в чергу знову
+                job.update(status=PENDING, error=None)
+            self._save()
+            return job
+
+    def add_many(self, pairs):
+        return [self.add(model_id, model_version_id) for model_id, model_version_id in pairs]
+
+    def pending(self):
+        with self._lock:
+            return [job for job in self.jobs if job.get("status") in (PENDING, RUNNING)]
+
+    def mark(self, job, status, **fields):
+        with self._lock:
+            job.update(fields, status=status, updated_at=time.time())
+            self._save()
+
+    def summary(self):
+        with self._lock:
+            counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self.jobs:
+                counts[job.get("status", PENDING)] += 1
+            return counts
+
+    def _save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"jobs": self.jobs}, f, indent=1)
+        os.replace(temp_path, self.path)
+
+
+class BatchRunner:
+    """Виконує завдання з JobQueue на спільних ресурсах.
+
+    Усі конвеєри ділять один пул потоків для зображень (workers), один
+    RateLimiter (загальний бюджет запитів), одну HTTP-сесію та один індекс.
+    Одночасно виконується до parallel_jobs завдань. Інші параметри
+    конвеєра передаються через pipeline_options.
+    """
+
+    def __init__(self, job_queue, api_key, download_folder, workers=4, parallel_jobs=2,
+                 log=print, is_running=None, **pipeline_options):
+        self.job_queue = job_queue
+        self.api_key = api_key
+        self.download_folder = download_folder
+        self.workers = max(1, int(workers))
+        self.parallel_jobs = max(1, int(parallel_jobs))
+        self.log = log
+        self._external_is_running = is_running or (lambda: True)
+        self._stop_event = threading.Event()
+        self.pipeline_options = pipeline_options
+        # Спільний бюджет запитів для всіх завдань
+        self.pipeline_options.setdefault("rate_limiter", RateLimiter())
+        self.stats = {"seen": 0, "downloaded": 0, "skipped": 0, "linked": 0,
+                      "filtered": 0, "failed": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+        self._active = set()
+
+    def is_running(self):
+        return not self._stop_event.is_set() and self._external_is_running()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def progress(self):
+        # Підсумок завершених завдань плюс поточні лічильники активних
+        with self._stats_lock:
+            totals = dict(self.stats)
+            active = list(self._active)
+        for pipeline in active:
+            for key, value in pipeline.progress().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def run(self):
+        jobs = self.job_queue.pending()
+        self.log(f"Завдань у черзі: {len(jobs)}")
+        options = dict(self.pipeline_options)
+        owns_index = options.get("index") is None
+        if owns_index:
+            options["index"] = DownloadIndex.for_folder(self.download_folder)
+        owns_session = options.get("session") is None
+        if owns_session:
+            options["session"] = create_session(pool_maxsize=self.workers + self.parallel_jobs)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as image_pool, \
+                    ThreadPoolExecutor(max_workers=self.parallel_jobs) as job_pool:
+                futures = [job_pool.submit(self._run_job, job, number, len(jobs), image_pool, options)
+                           for number, job in enumerate(jobs, 1)]
+                wait(futures)
+                for future in futures:
+                    future.result()
+        finally:
+            if owns_index:
+                options["index"].close()
+            if owns_session:
+                options["session"].close()
+        self._log_summary(jobs)
+        return self.stats
+
+    def _log_summary(self, jobs):
+        # Стан завдань цього запуску; зупинені лишаються в черзі
+        for job in jobs:
+            if job.get("status") == FAILED:
+                self.log(f"Завдання {job_label(job)} не виконано: {job.get('error')}")
+        counts = self.job_queue.summary()
+        self.log(f"Черга завдань: виконано {counts[DONE]}, з помилками {counts[FAILED]}, "
+                 f"не завершено {counts[PENDING] + counts[RUNNING]}")
+
+    def _run_job(self, job, number, total, image_pool, options):
+        if not self.is_running():
+            return
+        label = job_label(job)
+        # Завдання, перерване попереднім запуском, продовжуємо з чекпойнту
+        resume = options.get("resume", False) or job.get("status") == RUNNING
+        self.job_queue.mark(job, RUNNING)
+        self.log(f"Завдання {number}/{total}: модель {label}")
+
+        options = dict(options, resume=resume)
+        pipeline = DownloadPipeline(
+            self.api_key, job["model_id"], job["model_version_id"], self.download_folder,
+            workers=self.workers, executor=image_pool,
+            log=lambda message: self.log(f"[{label}] {message}"),
+            is_running=self.is_running, **options)
+        with self._stats_lock:
+            self._active.add(pipeline)
+        try:
+            stats = pipeline.run()
+        except Exception as e:
+            self.job_queue.mark(job, FAILED, error=str(e))
+            self.log(f"Завдання {number}/{total}: модель {label} - помилка: {e}")
+            stats = None
+        finally:
+            with self._stats_lock:
+                self._active.discard(pipeline)
+                for key, value in pipeline.progress().items():
+                    self.stats[key] = self.stats.get(key, 0) + value
+        if stats is None:
+            return
+        # Зупинене завдання лишається в черзі і продовжиться наступного разу
+        if not self.is_running():
+            return
+        self.job_queue.mark(job, DONE, stats=stats, error=None)
+        self.log(f"Завдання {number}/{total}: модель {label} - завершено "
+                 f"(завантажено {stats['downloaded']}, пропущено {stats['skipped']}, "
+                 f"пов'язано {stats['linked']}, відфільтровано {stats['filtered']}, "
+                 f"помилок {stats['failed']})")
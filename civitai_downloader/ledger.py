@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+from civitai_downloader.pipeline import DownloadPipeline
+from civitai_downloader.index import DownloadIndex
+from civitai_downloader.filters import ImageFilter
+
+LEDGER_FILENAME = "civitai_ledger.sqlite"
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# Скільки разів одиницю роботи видають повторно після помилки чи втраченої оренди
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    model_id TEXT NOT NULL,
+    model_version_id TEXT NOT NULL,
+    options TEXT NOT NULL,
+    admitted INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    UNIQUE (model_id, model_version_id)
+);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_until);
+"""
+
+# Параметри запиту, спільні для всіх вузлів; решта налаштувань у кожного вузла своя
+JOB_OPTION_KEYS = ("nsfw", "sort", "period", "filters", "image_limit", "page_size")
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Ledger:
+    """Спільний реєстр роботи для кількох вузлів у файлі SQLite.
+
+    Завдання діляться на одиниці роботи (сторінка API або пакет зображень),
+    які вузли беруть в оренду на ttl секунд. Журнал SQLite звичайний, а не
+    WAL, щоб файл можна було покласти на спільний диск.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Транзакції відкриваються явно (BEGIN IMMEDIATE); timeout - очікування
+        # блокування іншим вузлом
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def _transaction(self, sql_calls):
+        # Виконує sql_calls(conn) в одній транзакції з блокуванням на запис
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = sql_calls(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _add_unit(conn, job_id, kind, payload):
+        conn.execute(
+            "INSERT INTO units (job_id, kind, payload, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), PENDING, time.time()))
+
+    def add_job(self, model_id, model_version_id, options):
+        """Додає завдання з першою сторінкою; завершене завдання починається знову."""
+        model_id, model_version_id = str(model_id), str(model_version_id or "")
+        options = {key: options.get(key) for key in JOB_OPTION_KEYS}
+
+        def add(conn):
+            row = conn.execute("SELECT id FROM jobs WHERE model_id = ? AND model_version_id = ?",
+                               (model_id, model_version_id)).fetchone()
+            if row is None:
+                job_id = conn.execute(
+                    "INSERT INTO jobs (model_id, model_version_id, options, created_at) VALUES (?, ?, ?, ?)",
+                    (model_id, model_version_id, json.dumps(options), time.time())).lastrowid
+            else:
+                job_id = row[0]
+                active = conn.execute("SELECT COUNT(*) FROM units WHERE job_id = ? AND status IN (?, ?)",
+                                      (job_id, PENDING, LEASED)).fetchone()[0]
+                if active:
+                    return False
+                conn.execute("UPDATE jobs SET options = ?, admitted = 0 WHERE id = ?",
+                             (json.dumps(options), job_id))
+            self._add_unit(conn, job_id, "page", {"url": None})
+            return True
+
+        return self._transaction(add)
+
+    def lease(self, worker, ttl):
+        """Видає одиницю роботи в оренду worker або повертає None.
+
+        Сторінки видаються першими: кожна з них створює роботу для решти
+        вузлів. Одиниця з простроченою орендою видається повторно, а після
+        MAX_ATTEMPTS спроб позначається як невдала.
+        """
+        def lease(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE units SET status = ?, error = 'оренда сплила', updated_at = ? "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, MAX_ATTEMPTS))
+            row = conn.execute(
+                "SELECT u.id, u.kind, u.payload, u.attempts, u.worker, j.id, j.model_id, j.model_version_id, "
+                "j.options, j.admitted FROM units u JOIN jobs j ON j.id = u.job_id "
+                "WHERE u.status = ? OR (u.status = ? AND u.lease_until < ?) "
+                "ORDER BY u.kind = 'page' DESC, u.id LIMIT 1", (PENDING, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE units SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, "
+                         "updated_at = ? WHERE id = ?", (LEASED, worker, now + ttl, now, row[0]))
+            return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1,
+                    "reclaimed_from": row[4], "job_id": row[5], "model_id": row[6],
+                    "model_version_id": row[7], "options": json.loads(row[8]), "admitted": row[9]}
+
+        return self._transaction(lease)
+
+    def renew(self, unit_id, worker, ttl):
+        """Продовжує оренду; False - оренду вже забрав інший вузол."""
+        def renew(conn):
+            return conn.execute(
+                "UPDATE units SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time() + ttl, time.time(), unit_id, worker, LEASED)).rowcount == 1
+
+        return self._transaction(renew)
+
+    def complete(self, unit, worker, new_units=(), admitted=0):
+        """Завершує одиницю і додає нові (kind, payload) однією транзакцією.
+
+        Повертає False, якщо оренду втрачено: тоді результат відкидається,
+        бо одиницю вже обробляє інший вузол.
+        """
+        def complete(conn):
+            updated = conn.execute(
+                "UPDATE units SET status = ?, error = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, time.time(), unit["id"], worker, LEASED)).rowcount
+            if not updated:
+                return False
+            for kind, payload in new_units:
+                self._add_unit(conn, unit["job_id"], kind, payload)
+            if admitted:
+                conn.execute("UPDATE jobs SET admitted = admitted + ? WHERE id = ?", (admitted, unit["job_id"]))
+            return True
+
+        return self._transaction(complete)
+
+    def fail(self, unit, worker, error):
+        # Одиниця повертається в чергу, поки не вичерпано спроби
+        status = FAILED if unit["attempts"] >= MAX_ATTEMPTS else PENDING
+
+        def fail(conn):
+            conn.execute("UPDATE units SET status = ?, error = ?, lease_until = NULL, updated_at = ? "
+                         "WHERE id = ? AND worker = ? AND status = ?",
+                         (status, str(error), time.time(), unit["id"], worker, LEASED))
+
+        self._transaction(fail)
+        return status
+
+    def active(self):
+        """Кількість одиниць, що чекають або виконуються."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM units WHERE status IN (?, ?)",
+                                      (PENDING, LEASED)).fetchone()[0]
+
+    def summary(self):
+        with self._lock:
+            counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+            for status, count in self._conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status"):
+                counts[status] = count
+            jobs = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(admitted), 0) FROM jobs").fetchone()
+        return dict(counts, jobs=jobs[0], admitted=jobs[1])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LedgerWorker:
+    """Вузол розподіленого завантаження: виконує одиниці роботи з Ledger.
+
+    Ресурси вузла (API ключ, обмежувач швидкості, сесія, індекс, папка)
+    задає pipeline_options, а параметри запиту беруться із завдання.
+    """
+
+    def __init__(self, ledger, api_key, download_folder, name=None, lease_ttl=300, poll_interval=5.0,
+                 log=print, is_running=None, **pipeline_options):
+        self.ledger = ledger
+        self.api_key = api_key
+        self.download_folder = download_folder
+        self.name = name or worker_name()
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.log = log
+        self._external_is_running = is_running or (lambda: True)
+        self._stop_event = threading.Event()
+        self.pipeline_options = pipeline_options
+        self.index = None
+        self.stats = {"pages": 0, "batches": 0, "seen": 0, "downloaded": 0, "skipped": 0, "linked": 0,
+                      "filtered": 0, "failed": 0, "bytes": 0}
+
+    def is_running(self):
+        return not self._stop_event.is_set() and self._external_is_running()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        self.log(f"Вузол {self.name}: реєстр {self.ledger.path}")
+        self.index = DownloadIndex.for_folder(self.download_folder)
+        try:
+            self._loop()
+        finally:
+            self.index.close()
+            self.index = None
+        return self.stats
+
+    def _loop(self):
+        while self.is_running():
+            unit = self.ledger.lease(self.name, self.lease_ttl)
+            if unit is None:
+                if not self.ledger.active():
+                    self.log("Роботи в реєстрі не лишилось.")
+                    break
+                # Інші вузли ще обробляють сторінки, які можуть додати роботу
+                self._stop_event.wait(self.poll_interval)
+                continue
+            if unit["reclaimed_from"] and unit["reclaimed_from"] != self.name:
+                self.log(f"Оренда вузла {unit['reclaimed_from']} сплила, одиницю {unit['id']} взято повторно")
+            self._run_unit(unit)
+
+    def _pipeline(self, unit, **overrides):
+        options = unit["options"]
+        pipeline_options = dict(
+            self.pipeline_options, nsfw=options["nsfw"], sort=options["sort"], period=options["period"],
+            image_filter=ImageFilter.from_dict(options["filters"]), page_size=options["page_size"],
+            image_limit=options["image_limit"], sync=False, index=self.index)
+        pipeline_options.update(overrides)
+        label = unit["model_id"] + (f"/{unit['model_version_id']}" if unit["model_version_id"] else "")
+        return DownloadPipeline(
+            self.api_key, unit["model_id"], unit["model_version_id"], self.download_folder,
+            log=lambda message: self.log(f"[{label}] {message}"), is_running=self.is_running,
+            **pipeline_options)
+
+    def _run_unit(self, unit):
+        lost = threading.Event()
+        done = threading.Event()
+        pipeline = None
+
+        def heartbeat():
+            while not done.wait(self.lease_ttl / 3):
+                if not self.ledger.renew(unit["id"], self.name, self.lease_ttl):
+                    lost.set()
+                    if pipeline is not None:
+                        pipeline.stop()
+                    return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            if unit["kind"] == "page":
+                new_units, admitted = self._run_page(unit)
+            else:
+                pipeline = self._pipeline(unit, planned_items=unit["payload"]["items"], image_limit=0)
+                stats = pipeline.run()
+                self._add_stats(stats)
+                self.stats["batches"] += 1
+                if stats["failed"]:
+                    raise IOError(f"не завантажено зображень: {stats['failed']}")
+                new_units, admitted = (), 0
+        except Exception as e:
+            done.set()
+            if not lost.is_set() and self.is_running():
+                status = self.ledger.fail(unit, self.name, e)
+                self.log(f"Одиниця {unit['id']} ({unit['kind']}): помилка: {e}"
+                         + (" - спроби вичерпано" if status == FAILED else " - повернуто в чергу"))
+            return
+        finally:
+            done.set()
+            thread.join()
+        if lost.is_set() or not self.is_running():
+            # Незавершена одиниця повернеться в роботу, коли спливе оренда
+            return
+        if not self.ledger.complete(unit, self.name, new_units, admitted):
+            self.log(f"Оренду одиниці {unit['id']} втрачено, результат відкинуто")
+
+    def _run_page(self, unit):
+        # Повертає нові одиниці та кількість зображень, зарахованих у ліміт
+        pipeline = self._pipeline(unit, admitted=unit["admitted"])
+        with pipeline.resources():
+            limit = pipeline.next_page_limit()
+            if not limit:
+                return (), 0
+            url, params = pipeline.page_request(unit["payload"]["url"], pipeline.build_params(), limit)
+            data = pipeline.fetch_page(url, pipeline.build_headers(), params)
+        if data is None:
+            raise IOError(f"не вдалося отримати сторінку {url}")
+        items = data.get("items", [])
+        accepted, rejected, cut = pipeline.admit(items)
+        next_page = data.get("metadata", {}).get("nextPage") if items else None
+        self.stats["pages"] += 1
+        self.stats["seen"] += len(items) - cut
+        self.stats["filtered"] += rejected
+        new_units = []
+        if accepted:
+            new_units.append(("images", {"items": accepted}))
+        if next_page and not cut and pipeline.next_page_limit():
+            new_units.append(("page", {"url": next_page}))
+        self.log(f"Сторінка {unit['model_id']}: зображень {len(items)}, у пакет {len(accepted)}"
+                 + ("" if next_page else ", остання сторінка"))
+        return new_units, len(accepted)
+
+    def _add_stats(self, stats):
+        # seen уже пораховано під час обробки сторінок
+        for key in ("downloaded", "skipped", "linked", "failed", "bytes"):
+            self.stats[key] += stats.get(key, 0)
@@ -0,0 +1,83 @@
+import os
+import json
+import threading
+
+METADATA_FILENAME = "civitai_metadata.jsonl"
+
+PROMPT_UNAVAILABLE = "Підказка недоступна."
+
+
+def prompt_path(image_path):
+    return f"{os.path.splitext(image_path)[0]}.txt"
+
+
+def prompt_text(item):
+    meta = item.get("meta") or {}
+    return meta.get("prompt", PROMPT_UNAVAILABLE)
+
+
+def write_prompt_file(item, image_path):
+    with open(prompt_path(image_path), "w", encoding="utf-8") as prompt_file:
+        prompt_file.write(prompt_text(item))
+
+
+class MetadataStore:
+    """Повні метадані зображень моделі/версії у файлі JSON Lines.
+
+    Кожен рядок - елемент відповіді API (seed, sampler, негативна підказка,
+    розміри, статистика, рівень NSFW тощо) з додатковим полем file - ім'ям
+    файлу зображення в папці моделі. Записи накопичуються в пам'яті і
+    дописуються в кінець файлу одним записом на сторінку API. Файл лише
+    доповнюється, тож при повторному завантаженні зображення дійсним
+    вважається останній запис з тим самим id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = []
+
+    @classmethod
+    def for_model_dir(cls, model_dir):
+        return cls(os.path.join(model_dir, METADATA_FILENAME))
+
+    def add(self, item, image_path):
+        record = dict(item, file=os.path.basename(image_path))
+        with self._lock:
+            self._pending.append(record)
+
+    def flush(self):
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return 0
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return len(records)
+
+    def records(self):
+        """Повертає словник id -> останній запис для кожного зображення."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                # Рядок, обірваний аварійним завершенням, пропускаємо
+                try:
+                    record = json.loads(line) if line else None
+                except ValueError:
+                    continue
+                if record:
+                    records[record.get("id", record.get("file"))] = record
+        return records
+
+    def export_prompts(self):
+        """Створює файли .txt з підказками для всіх записів; повертає їх кількість."""
+        model_dir = os.path.dirname(self.path)
+        count = 0
+        for record in self.records().values():
+            write_prompt_file(record, os.path.join(model_dir, record["file"]))
+            count += 1
+        return count
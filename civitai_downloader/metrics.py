@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+METRICS_FILENAME = "civitai_metrics.jsonl"
+
+
+class Metrics:
+    """Метрики та таймінги конвеєра завантаження.
+
+    Кожна подія (сторінка API, зображення, пауза через 429/503) пишеться
+    рядком JSON у журнал path, якщо його вказано. Паралельно ведуться
+    лічильники та спостереження (кількість, сума, максимум), з яких в кінці
+    запуску складається підсумок: де саме минув час - API, CDN, обмежувач
+    швидкості чи диск. Один екземпляр безпечно використовувати з кількох
+    потоків і кількох конвеєрів пакетного режиму.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self.started = time.monotonic()
+        self.counters = {}
+        self.observations = {}
+
+    @classmethod
+    def for_folder(cls, download_folder):
+        os.makedirs(download_folder, exist_ok=True)
+        return cls(os.path.join(download_folder, METRICS_FILENAME))
+
+    def event(self, event, **fields):
+        if self._file is None:
+            return
+        record = dict(fields, event=event, time=round(time.time(), 3))
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        # Зберігаються кількість, сума та максимум - без окремих значень
+        with self._lock:
+            count, total, maximum = self.observations.get(name, (0, 0, 0))
+            self.observations[name] = (count + 1, total + value, max(maximum, value))
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def summary(self):
+        with self._lock:
+            observations = {
+                name: {"count": count, "total": round(total, 3),
+                       "avg": round(total / count, 3) if count else 0, "max": round(maximum, 3)}
+                for name, (count, total, maximum) in self.observations.items()}
+            return {"elapsed": round(time.monotonic() - self.started, 3),
+                    "counters": dict(self.counters), "observations": observations}
+
+    def format_summary(self):
+        """Підсумок запуску українською, по рядку на етап."""
+        summary = self.summary()
+        counters = summary["counters"]
+        empty = {"count": 0, "total": 0, "avg": 0, "max": 0}
+        observed = lambda name: summary["observations"].get(name, empty)
+        pages, images = observed("api_page"), observed("image_download")
+        megabytes = counters.get("bytes", 0) / 1048576
+        speed = megabytes / summary["elapsed"] if summary["elapsed"] else 0
+        return [
+            f"Час роботи: {summary['elapsed']:.1f} с",
+            f"Сторінок API: {pages['count']} (з кешу {counters.get('page_cache_hits', 0)}, "
+            f"підтверджено 304: {counters.get('page_cache_revalidated', 0)}), "
+            f"затримка в середньому {pages['avg']:.2f} с, максимум {pages['max']:.2f} с",
+            f"Зображень: {images['count']}, {megabytes:.1f} МБ ({speed:.2f} МБ/с), "
+            f"в середньому {images['avg']:.2f} с на зображення",
+            f"Очікування обмежувача швидкості (сумарно по потоках): {observed('rate_limit_wait')['total']:.1f} с, "
+            f"відповідей 429/503: {counters.get('throttled', 0)}, "
+            f"повторів HTTP: {counters.get('http_retries', 0)}",
+            f"Запис на диск: {observed('disk_write')['total']:.1f} с, "
+            f"черга сторінок до {observed('page_queue')['max']}, "
+            f"черга зображень до {observed('image_queue')['max']}",
+        ] + ([
+            f"Перетворено зображень: {counters.get('transcoded', 0)}, "
+            f"в середньому {observed('transcode')['avg']:.2f} с процесора на зображення",
+        ] if "transcode" in summary["observations"] else [])
+
+    def close(self):
+        # Підсумок - останній рядок журналу запуску
+        self.event("summary", **self.summary())
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
@@ -0,0 +1,101 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+PAGE_CACHE_FILENAME = "civitai_page_cache.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at);
+"""
+
+
+def cache_key(url, params=None, api_key=""):
+    """Ключ сторінки: URL з відсортованими параметрами запиту.
+
+    Хеш API ключа входить у ключ, бо від нього залежить видача (NSFW).
+    """
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query) + [(k, str(v)) for k, v in (params or {}).items()]
+    normalized = urlunparse(parsed._replace(query=urlencode(sorted(query))))
+    if api_key:
+        normalized += "#" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return normalized
+
+
+class PageCache:
+    """Кеш відповідей /api/v1/images на диску (SQLite).
+
+    Сторінки, молодші за ttl секунд, беруться без запиту, старіші
+    перевіряються умовним запитом. Розмір обмежено max_bytes. Безпечний
+    для використання з кількох потоків.
+    """
+
+    def __init__(self, path, ttl=3600, max_bytes=256 * 1048576):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def for_folder(cls, download_folder, ttl=3600, max_bytes=256 * 1048576):
+        os.makedirs(download_folder, exist_ok=True)
+        return cls(os.path.join(download_folder, PAGE_CACHE_FILENAME), ttl, max_bytes)
+
+    def get(self, key):
+        """Повертає (body, etag, вік у секундах) або None."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT body, etag, fetched_at FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (now, key))
+        return bytes(row[0]), row[1], now - row[2]
+
+    def is_fresh(self, age):
+        return age < self.ttl
+
+    def put(self, key, body, etag=None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (key, body, etag, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, body, etag, len(body), now, now))
+            self._evict()
+
+    def refresh(self, key):
+        # Сервер підтвердив (304), що сторінка не змінилась
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM pages ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,691 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+import requests
+
+from civitai_downloader.ratelimit import RateLimiter, THROTTLE_STATUS_CODES, parse_retry_after
+from civitai_downloader.storage import PartialDownload
+from civitai_downloader.index import DownloadIndex
+from civitai_downloader.checkpoint import Checkpoint
+from civitai_downloader.session import create_session, DEFAULT_TIMEOUT
+from civitai_downloader.content_store import ContentStore
+from civitai_downloader.metrics import Metrics
+from civitai_downloader.metadata import MetadataStore, prompt_text, write_prompt_file
+from civitai_downloader.shards import ShardWriter, DEFAULT_SHARD_BYTES
+from civitai_downloader.filters import ImageFilter
+from civitai_downloader.cdn import VARIANT_UNAVAILABLE_STATUSES, target_width, variant_url
+from civitai_downloader.page_cache import cache_key
+
+BASE_URL = "https://civitai.com/api/v1/images"
+
+# Найбільший розмір сторінки, який приймає /api/v1/images
+MAX_PAGE_SIZE = 200
+
+# files - окремі файли в папках моделей, shards - tar-шарди WebDataset
+OUTPUT_MODES = ("files", "shards")
+
+# Маркер кінця черги сторінок
+_END_OF_PAGES = object()
+
+
+class DownloadPipeline:
+    """Конвеєр завантаження зображень, спільний для CLI та GUI.
+
+    Потік-виробник наперед запитує до prefetch_pages сторінок API, а
+    зображення завантажуються пулом потоків у темпі спільного RateLimiter.
+    Вже відомі індексу зображення пропускаються. image_limit - загальна
+    кількість зображень моделі/версії (0 - без обмеження).
+    """
+
+    def __init__(self, api_key, model_id, model_version_id, download_folder,
+                 image_limit=100, nsfw='X', workers=4, rate_limiter=None,
+                 log=print, is_running=None, base_url=BASE_URL, index=None,
+                 resume=False, prefetch_pages=2, session=None, executor=None,
+                 dedup=True, link_mode="hardlink", metrics=None, prompt_files=True,
+                 sort="Most Reactions", period=None, image_filter=None,
+                 output="files", shard_size=DEFAULT_SHARD_BYTES, sync=False, transcoder=None,
+                 max_image_size=0, page_cache=None, planned_items=None, page_size=MAX_PAGE_SIZE,
+                 timeout=DEFAULT_TIMEOUT, admitted=0):
+        self.api_key = api_key
+        self.model_id = model_id
+        self.model_version_id = model_version_id
+        self.download_folder = download_folder
+        self.image_limit = max(0, int(image_limit or 0))
+        self.page_size = min(MAX_PAGE_SIZE, max(1, int(page_size or MAX_PAGE_SIZE)))
+        self.nsfw = nsfw
+        self.workers = max(1, int(workers))
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.log = log
+        self.base_url = base_url
+        self.index = index
+        self.resume = resume
+        self.prefetch_pages = max(1, int(prefetch_pages))
+        self.session = session
+        self.timeout = tuple(timeout) if timeout else None
+        # Спільний пул потоків для кількох конвеєрів (пакетні завдання)
+        self.executor = executor
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"Невідомий режим збереження: {output}")
+        self.output = output
+        self.shard_size = shard_size
+        self.shards = None
+        # Перетворення працює з окремими файлами, не з шардами
+        self.transcoder = transcoder if output == "files" else None
+        self.max_image_size = int(max_image_size or 0)
+        self.page_cache = page_cache
+        self.planned_items = planned_items
+        # У шардах посилання неможливі, тож сховище за хешем не використовується
+        self.store = ContentStore.for_folder(download_folder, link_mode) if dedup and output == "files" else None
+        self.metrics = metrics or Metrics()
+        self.prompt_files = prompt_files
+        self.metadata = None
+        self.sync = sync
+        # Позначка синхронізації має сенс лише для порядку від найновіших
+        self.sort = "Newest" if sync else sort
+        self.period = period
+        self._sync_mark = None
+        self._newest = None
+        self.image_filter = image_filter or ImageFilter()
+        self._external_is_running = is_running or (lambda: True)
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        # Бюджет image_limit: прийняті зображення та зображення сторінок,
+        # що ще чекають у черзі; виробник чекає на зміни бюджету.
+        # admitted - зображення, вже зараховані в ліміт до цього конвеєра
+        # (наприклад, іншими вузлами розподіленого завантаження)
+        self._admitted = int(admitted)
+        self._queued = 0
+        self._budget_changed = threading.Condition(self._stats_lock)
+        # seen - кількість зображень в уже отриманих сторінках API
+        self.stats = {"seen": 0, "downloaded": 0, "skipped": 0, "linked": 0,
+                      "filtered": 0, "failed": 0, "bytes": 0}
+
+    def is_running(self):
+        return not self._stop_event.is_set() and self._external_is_running()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def progress(self):
+        # Знімок лічильників для відображення прогресу з іншого потоку
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def request(self, url, max_attempts=5, method="GET", **kwargs):
+        """Запит через обмежувач швидкості; на 429/503 чекає і повторює.
+
+        Повертає None, якщо завантаження зупинено під час очікування.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        response = None
+        for attempt in range(max_attempts):
+            with self.metrics.timer("rate_limit_wait"):
+                if not self.rate_limiter.acquire(self._stop_event):
+                    return None
+            response = self.session.request(method, url, **kwargs)
+            # Повтори 5xx і збоїв з'єднання, зроблені urllib3 всередині сесії
+            retries = getattr(response.raw, "retries", None)
+            if retries is not None and retries.history:
+                self.metrics.add("http_retries", len(retries.history))
+            if response.status_code not in THROTTLE_STATUS_CODES:
+                self.rate_limiter.on_success()
+                return response
+            response.close()
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            pause = self.rate_limiter.on_throttle(retry_after)
+            self.metrics.add("throttled")
+            self.metrics.event("throttle", url=url, status=response.status_code, pause=round(pause, 3))
+            self.log(f"Сервер обмежує запити ({response.status_code}), пауза {pause:.1f} с")
+        return response
+
+    def build_headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def build_params(self):
+        params = {
+            "limit": min(self.page_size, self.image_limit) if self.image_limit else self.page_size,
+            "modelId": self.model_id,
+            "modelVersionId": self.model_version_id if self.model_version_id else None,
+            "nsfw": self.nsfw,
+            "sort": self.sort,
+            "period": self.period or None
+        }
+        # Видалити None значення з параметрів
+        return {k: v for k, v in params.items() if v is not None}
+
+    def model_dir(self):
+        model_dir = os.path.join(self.download_folder, str(self.model_id))
+        if self.model_version_id:
+            model_dir = os.path.join(model_dir, str(self.model_version_id))
+        return model_dir
+
+    def prepare_model_dir(self):
+        model_dir = self.model_dir()
+        os.makedirs(model_dir, exist_ok=True)
+        return model_dir
+
+    def request_url(self, item):
+        # Зменшений варіант CDN; ім'я файлу лишається як в оригіналу
+        width = target_width(item, self.max_image_size) if self.max_image_size else None
+        return variant_url(item["url"], width) if width else item["url"]
+
+    def next_page_limit(self):
+        """Розмір наступної сторінки API; 0 - ліміт зображень вичерпано.
+
+        Залишок ліміту зменшується на зображення сторінок, що вже чекають у
+        черзі. Якщо в черзі весь залишок, виробник чекає, поки споживач її
+        розбере: частину зображень може відкинути фільтр.
+        """
+        if not self.image_limit:
+            return self.page_size
+        with self._budget_changed:
+            while self.is_running():
+                remaining = self.image_limit - self._admitted
+                if remaining <= 0:
+                    return 0
+                if remaining > self._queued:
+                    return min(self.page_size, remaining - self._queued)
+                self._budget_changed.wait(0.5)
+        return 0
+
+    def page_request(self, next_page_url, params, limit):
+        # Повертає (URL, параметри) сторінки; у курсорі nextPage розмір
+        # сторінки замінюється на limit
+        if not next_page_url:
+            return self.base_url, dict(params, limit=limit)
+        parsed = urlparse(next_page_url)
+        query = [(key, value) for key, value in parse_qsl(parsed.query) if key != "limit"]
+        query.append(("limit", str(limit)))
+        return urlunparse(parsed._replace(query=urlencode(query))), {}
+
+    def admit(self, items):
+        """Відбирає зображення сторінки в межах image_limit у порядку видачі API.
+
+        Повертає (прийняті фільтром, кількість відкинутих, кількість
+        елементів, що не вмістились у ліміт). Уже завантажені зображення
+        теж займають місце в ліміті, тож повторний запуск з тим самим
+        лімітом не завантажує нових.
+        """
+        with self._stats_lock:
+            remaining = self.image_limit - self._admitted if self.image_limit else None
+        accepted, rejected = [], 0
+        for position, item in enumerate(items):
+            if remaining is not None and len(accepted) >= remaining:
+                cut = len(items) - position
+                break
+            if self.image_filter.rejects(item) is None:
+                accepted.append(item)
+            else:
+                rejected += 1
+        else:
+            cut = 0
+        with self._budget_changed:
+            self._admitted += len(accepted)
+            self._budget_changed.notify_all()
+        return accepted, rejected, cut
+
+    def _set_queued(self, amount):
+        with self._budget_changed:
+            self._queued += amount
+            self._budget_changed.notify_all()
+
+    def run(self):
+        with self.resources():
+            return self._run()
+
+    @contextmanager
+    def resources(self):
+        # Індекс і сесія, не передані ззовні, існують лише на час обходу
+        owns_index = self.index is None
+        if owns_index:
+            self.index = DownloadIndex.for_folder(self.download_folder)
+        owns_session = self.session is None
+        if owns_session:
+            # Пул на хост: по з'єднанню на кожен потік пулу та виробника сторінок
+            self.session = create_session(pool_maxsize=self.workers + 1)
+        try:
+            yield
+        finally:
+            if owns_index:
+                self.index.close()
+                self.index = None
+            if owns_session:
+                self.session.close()
+                self.session = None
+
+    def filter_known(self, items, model_dir):
+        # Одним запитом до індексу відкидаємо зображення сторінки, вже
+        # розміщені в папці цієї моделі/версії
+        ids = [int(item["id"]) for item in items if item.get("id") is not None]
+        if not ids:
+            return items
+        known = self.index.known_ids(ids, self.model_id, self.model_version_id)
+        if known:
+            self._count("skipped", len(known))
+            self.log(f"Пропущено вже завантажених зображень: {len(known)}")
+
+        # Зображення, завантажені для інших моделей, лише пов'язуємо
+        elsewhere = {}
+        if self.store is not None:
+            elsewhere = self.index.records([i for i in ids if i not in known])
+        remaining = []
+        for item in items:
+            image_id = int(item["id"]) if item.get("id") is not None else None
+            if image_id in known:
+                continue
+            if image_id in elsewhere and self.link_known(item, elsewhere[image_id], model_dir):
+                continue
+            remaining.append(item)
+        return remaining
+
+    def link_known(self, item, record, model_dir):
+        # Джерело - файл у сховищі або, для старих записів, файл іншої моделі
+        source = None
+        if record["sha256"]:
+            blob = self.store.blob_path(record["sha256"], os.path.splitext(record["path"])[1])
+            if os.path.exists(blob):
+                source = blob
+        if source is None:
+            path = os.path.join(self.download_folder, record["path"])
+            if not os.path.exists(path):
+                return False
+            source = path
+
+        image_path = os.path.join(model_dir, os.path.basename(urlparse(item["url"]).path))
+        if not os.path.exists(image_path):
+            self.write_metadata(item, image_path)
+            self.store.link(source, image_path)
+            # Похідні файли створюються поруч із кожним розміщенням
+            if self.transcoder is not None:
+                self.transcoder.submit(image_path, self.log, self.metrics)
+        self.index.add_placement(item["id"], self.model_id, self.model_version_id,
+                                 os.path.relpath(image_path, self.download_folder))
+        self._count("linked")
+        self.log(f"Зображення вже завантажене для іншої моделі, пов'язано: {os.path.basename(image_path)}")
+        return True
+
+    def write_metadata(self, item, image_path):
+        # Метадані потрапляють на диск пакетом після сторінки (_finish_page)
+        self.metadata.add(item, image_path)
+        if self.prompt_files:
+            write_prompt_file(item, image_path)
+
+    def start_checkpoint(self, params):
+        # Повертає чекпойнт і курсор, з якого починати обхід
+        checkpoint = Checkpoint.for_model_dir(self.prepare_model_dir())
+        # Синхронізація завжди починає з першої сторінки: там найновіші зображення
+        state = checkpoint.load(params) if self.resume and not self.sync else None
+        if state and not state.get("completed") and state.get("next_page"):
+            self.log(f"Продовжуємо з сторінки {state['pages_done'] + 1}: {state['next_page']}")
+            # Зображення пройдених сторінок уже враховані в ліміті
+            self._admitted = state.get("images", 0)
+            return checkpoint, state["next_page"]
+        if state and state.get("completed"):
+            self.log("Попередній обхід завершено, починаємо з першої сторінки.")
+        checkpoint.start(params)
+        return checkpoint, None
+
+    def _produce_pages(self, pages, headers, params, next_page_url):
+        # Потік-виробник: запитує сторінки API і кладе їх у чергу pages.
+        # Заповнена черга блокує виробника, тож пам'ять не росте без меж.
+        try:
+            while self.is_running():
+                limit = self.next_page_limit()
+                if not limit:
+                    if self.is_running():
+                        self.log(f"Досягнуто ліміту зображень ({self.image_limit}), обхід сторінок завершено.")
+                    break
+                url, page_params = self.page_request(next_page_url, params, limit)
+                self.log(f"Запит до: {url}")
+
+                started = time.perf_counter()
+                data = self.fetch_page(url, headers, page_params)
+                if data is None:
+                    break
+                elapsed = time.perf_counter() - started
+                items = data.get("items", [])
+                next_page_url = data.get("metadata", {}).get("nextPage") if items else None
+                self.metrics.observe("api_page", elapsed)
+                self.metrics.event("api_page", model_id=self.model_id, url=url,
+                                   items=len(items), seconds=round(elapsed, 3))
+                if self.sync:
+                    items, reached_mark = self.newer_than_mark(items)
+                    if reached_mark:
+                        self.log("Досягнуто вже синхронізованих зображень, обхід сторінок завершено.")
+                        next_page_url = None
+                self._set_queued(len(items))
+                if not self._put_page(pages, {"items": items, "next_page": next_page_url}):
+                    break
+                if not next_page_url:
+                    break
+        except Exception as e:
+            self._put_page(pages, e)
+        finally:
+            self._put_page(pages, _END_OF_PAGES)
+
+    def fetch_page(self, url, headers, params):
+        # Повертає розібрану сторінку API або None, якщо завантаження
+        # зупинено чи сервер відповів помилкою
+        key = cache_key(url, params, self.api_key) if self.page_cache is not None else None
+        cached = self.page_cache.get(key) if key else None
+        if cached:
+            body, etag, age = cached
+            # Синхронізація шукає нові зображення, тож завжди питає сервер
+            if self.page_cache.is_fresh(age) and not self.sync:
+                self.metrics.add("page_cache_hits")
+                return json.loads(body)
+            if etag:
+                headers = dict(headers, **{"If-None-Match": etag})
+
+        response = self.request(url, headers=headers, params=params)
+        if response is None:
+            return None
+        if cached and response.status_code == 304:
+            response.close()
+            self.page_cache.refresh(key)
+            self.metrics.add("page_cache_revalidated")
+            return json.loads(cached[0])
+        if response.status_code != 200:
+            self.log(f"Помилка: {response.status_code} - {response.text}")
+            return None
+        if key:
+            self.page_cache.put(key, response.content, response.headers.get("ETag"))
+        return response.json()
+
+    @staticmethod
+    def _sync_key(item):
+        # Порядок "Newest": за датою створення, за однакової дати - за id
+        return (item.get("createdAt") or "", int(item.get("id") or 0))
+
+    def newer_than_mark(self, items):
+        """Повертає (зображення, новіші за позначку синхронізації; чи досягнуто позначки)."""
+        if items:
+            newest = max(items, key=self._sync_key)
+            if self._newest is None or self._sync_key(newest) > self._sync_key(self._newest):
+                self._newest = newest
+        if self._sync_mark is None:
+            return items, False
+        mark_id, mark_created = self._sync_mark
+        mark = (mark_created or "", int(mark_id or 0))
+        newer = [item for item in items if self._sync_key(item) > mark]
+        return newer, len(newer) < len(items)
+
+    def _update_sync_mark(self, checkpoint):
+        # Позначка зсувається лише після повного обходу без помилок, інакше
+        # пропущені зображення більше не потрапили б у синхронізацію
+        if not checkpoint.state.get("completed") or self._newest is None:
+            return
+        if self.stats["failed"]:
+            self.log("Позначку синхронізації не оновлено: були помилки завантаження.")
+            return
+        self.index.set_sync_mark(self.model_id, self.model_version_id,
+                                 self._newest.get("id"), self._newest.get("createdAt"))
+
+    def _produce_planned(self, pages):
+        # Елементи маніфесту йдуть у чергу сторінками по page_size
+        try:
+            for start in range(0, len(self.planned_items), self.page_size):
+                page = {"items": self.planned_items[start:start + self.page_size], "next_page": None}
+                self._set_queued(len(page["items"]))
+                if not self._put_page(pages, page):
+                    break
+        finally:
+            self._put_page(pages, _END_OF_PAGES)
+
+    def load_sync_mark(self):
+        self._sync_mark = self.index.sync_mark(self.model_id, self.model_version_id)
+        if self._sync_mark:
+            self.log(f"Синхронізація: лише зображення, новіші за {self._sync_mark[1] or self._sync_mark[0]}")
+        return self._sync_mark
+
+    def _put_page(self, pages, page):
+        while True:
+            try:
+                pages.put(page, timeout=0.5)
+                return True
+            except queue.Full:
+                # Після зупинки споживач черги більше не читає
+                if not self.is_running():
+                    return False
+
+    def _get_page(self, pages):
+        while self.is_running():
+            try:
+                return pages.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END_OF_PAGES
+
+    def _finish_page(self, checkpoint, page, futures):
+        wait(futures)
+        self.metadata.flush()
+        for future in futures:
+            future.result()
+        # Сторінку, оброблену не до кінця через зупинку, не зараховуємо
+        if not self.is_running():
+            return False
+        # Сторінку, обрізану лімітом, наступний запуск з --resume почне знову
+        if checkpoint is not None and not page["cut"]:
+            checkpoint.page_done(page["next_page"], page["admitted"])
+        return True
+
+    def _run(self):
+        model_dir = self.prepare_model_dir()
+        pages = queue.Queue(maxsize=self.prefetch_pages)
+        if self.planned_items is not None:
+            # Маніфест не має курсора API, повторний запуск відсіює
+            # завантажене за індексом
+            checkpoint = None
+            producer = threading.Thread(target=self._produce_planned, args=(pages,), daemon=True)
+        else:
+            params = self.build_params()
+            checkpoint, next_page_url = self.start_checkpoint(params)
+            if self.sync:
+                self.load_sync_mark()
+            producer = threading.Thread(
+                target=self._produce_pages, args=(pages, self.build_headers(), params, next_page_url),
+                daemon=True)
+        self.metadata = MetadataStore.for_model_dir(model_dir)
+        if self.output == "shards":
+            self.shards = ShardWriter.for_model_dir(model_dir, self.shard_size)
+        producer.start()
+
+        executor = self.executor or ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            try:
+                self._consume_pages(pages, executor, checkpoint, model_dir)
+                if self.sync and checkpoint is not None:
+                    self._update_sync_mark(checkpoint)
+            except BaseException:
+                # Не чекаємо, поки пул дозавантажить решту черги
+                self.stop()
+                raise
+            finally:
+                if executor is not self.executor:
+                    executor.shutdown(wait=True)
+        finally:
+            # Зупиняє виробника, якщо споживач завершився раніше за нього
+            self.stop()
+            producer.join()
+            # Метадані зображень, завантажених до зупинки чи помилки
+            self.metadata.flush()
+            if self.shards is not None:
+                self.shards.close()
+
+        return self.stats
+
+    def _consume_pages(self, pages, executor, checkpoint, model_dir):
+        # Сторінки, зображення яких ще завантажуються; не більше двох, щоб
+        # чекпойнт зараховував сторінки строго по порядку
+        in_flight = deque()
+        reached_end = False
+        while True:
+            page = self._get_page(pages)
+            if page is _END_OF_PAGES:
+                break
+            if isinstance(page, Exception):
+                raise page
+
+            if not page["items"]:
+                self.log("Більше немає зображень для завантаження.")
+                reached_end = True
+                break
+
+            # Правила фільтра і ліміт перевіряються до індексу та мережі
+            items, rejected, cut = self.admit(page["items"])
+            self._set_queued(-len(page["items"]))
+            page.update(admitted=len(items), cut=cut)
+            self._count("seen", len(page["items"]) - cut)
+            if cut:
+                self.log(f"Досягнуто ліміту зображень ({self.image_limit}), решту сторінки пропущено: {cut}")
+            if rejected:
+                self._count("filtered", rejected)
+                self.metrics.add("filtered", rejected)
+                self.log(f"Відфільтровано зображень: {rejected}")
+            items = self.filter_known(items, model_dir)
+            # Глибина черг: готові сторінки та зображення, що чекають на пул
+            waiting = sum(not future.done() for _, futures in in_flight for future in futures)
+            self.metrics.observe("page_queue", pages.qsize())
+            self.metrics.observe("image_queue", waiting)
+            self.metrics.event("page", model_id=self.model_id, items=len(page["items"]),
+                               new=len(items), page_queue=pages.qsize(), image_queue=waiting)
+
+            # Пул обмежує кількість одночасних передач числом workers
+            futures = [executor.submit(self.download_item, item, model_dir) for item in items]
+            in_flight.append((page, futures))
+            if len(in_flight) > 1 and not self._finish_page(checkpoint, *in_flight.popleft()):
+                return
+
+        while in_flight:
+            if not self._finish_page(checkpoint, *in_flight.popleft()):
+                return
+        if reached_end and checkpoint is not None:
+            checkpoint.page_done(None)
+
+    def download_item(self, item, model_dir):
+        if not self.is_running():
+            return
+
+        image_url = item.get("url")
+        if not image_url:
+            return
+
+        # Витягти ім'я файлу зображення
+        parsed_url = urlparse(image_url)
+        image_name = os.path.basename(parsed_url.path)
+        image_path = os.path.join(model_dir, image_name)
+
+        # Файл, завантажений до появи індексу, лише реєструємо в індексі
+        if os.path.exists(image_path):
+            self.log(f"Зображення вже існує, пропускаємо: {image_name}")
+            self._record(item, image_url, image_path, os.path.getsize(image_path))
+            self.metadata.add(item, image_path)
+            self._count("skipped")
+            return
+
+        request_url = self.request_url(item)
+        partial = PartialDownload(image_path, request_url)
+        resume_headers = partial.request_headers()
+        if resume_headers:
+            self.log(f"Продовжуємо завантаження {image_name} з {partial.offset} байт")
+
+        started = time.perf_counter()
+        try:
+            img_response = self.request(request_url, stream=True, headers=resume_headers)
+            if img_response is not None and img_response.status_code == 416 and resume_headers:
+                # Збережена частина не відповідає файлу на сервері - починаємо з нуля
+                img_response.close()
+                partial.discard()
+                img_response = self.request(request_url, stream=True)
+            if (img_response is not None and request_url != image_url
+                    and img_response.status_code in VARIANT_UNAVAILABLE_STATUSES):
+                # Варіанта немає - завантажуємо оригінал
+                img_response.close()
+                self.log(f"Зменшений варіант недоступний ({img_response.status_code}), завантажуємо оригінал: {image_name}")
+                partial.discard()
+                request_url = image_url
+                partial = PartialDownload(image_path, request_url)
+                img_response = self.request(request_url, stream=True)
+            if img_response is None:
+                return
+            if img_response.status_code not in (200, 206):
+                img_response.close()
+                self.log(f"Не вдалося завантажити зображення: {request_url}")
+                self._count("failed")
+                return
+
+            # Зображення пишеться частинами у .part файл, тож пам'ять
+            # не залежить від розміру файлу
+            size = partial.write(img_response, is_running=self.is_running)
+        except (requests.RequestException, OSError) as e:
+            self.log(f"Не вдалося завантажити зображення: {request_url} ({e})")
+            self._count("failed")
+            return
+
+        if size is None:
+            self.log(f"Завантаження перервано, частину збережено: {image_name}")
+            return
+        elapsed = time.perf_counter() - started
+
+        if self.shards is not None:
+            image_path = self.add_to_shard(item, image_path, partial.part_path)
+            partial.discard()
+        else:
+            # Підказка зберігається до перейменування зображення: якщо файл
+            # зображення існує, то і його підказка вже на диску
+            self.write_metadata(item, image_path)
+            if self.store is not None:
+                # Вміст кладеться у сховище один раз, у папку моделі - посилання
+                duplicate = self.store.import_file(partial.part_path, partial.sha256, image_path)
+                partial.discard()
+                if duplicate:
+                    self.log(f"Вміст {image_name} вже є у сховищі, збережено посилання")
+            else:
+                partial.finish()
+        self._record(item, request_url, image_path, size, partial.sha256)
+        self.log(f"Завантажено зображення: {image_name} ({size} байт)")
+        self._count("downloaded")
+        self._count("bytes", size)
+        if self.transcoder is not None:
+            self.transcoder.submit(image_path, self.log, self.metrics)
+
+        self.metrics.add("bytes", size)
+        self.metrics.observe("image_download", elapsed)
+        self.metrics.observe("disk_write", partial.write_time)
+        self.metrics.event("image", model_id=self.model_id, file=image_name, bytes=size,
+                           seconds=round(elapsed, 3), write_seconds=round(partial.write_time, 3),
+                           bytes_per_second=round(size / elapsed) if elapsed else None)
+
+    def add_to_shard(self, item, image_path, source):
+        # Зразок WebDataset: зображення, повний елемент API та, за бажанням,
+        # підказка під спільним ключем - ім'ям файлу без розширення
+        key, extension = os.path.splitext(os.path.basename(image_path))
+        members = [(extension[1:].lower() or "jpg", source),
+                   ("json", json.dumps(item, ensure_ascii=False).encode("utf-8"))]
+        if self.prompt_files:
+            members.append(("txt", prompt_text(item).encode("utf-8")))
+        shard = self.shards.add(key, members)
+        self.metadata.add(item, image_path)
+        # В індексі шлях має вигляд <модель>/<версія>/<шард>/<ім'я файлу>
+        return os.path.join(os.path.dirname(image_path), shard, os.path.basename(image_path))
+
+    def _record(self, item, image_url, image_path, size, sha256=None):
+        if item.get("id") is None:
+            return
+        # Шлях зберігається відносно папки завантаження, щоб її можна було перенести
+        self.index.add(
+            item["id"], image_url, os.path.relpath(image_path, self.download_folder),
+            size=size, sha256=sha256, model_id=self.model_id,
+            model_version_id=self.model_version_id)
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+PLAN_FILENAME = "civitai_plan.json"
+MANIFEST_VERSION = 1
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def estimate_seconds(requests_count, rate, burst):
+    # Token bucket: перші burst запитів ідуть одразу, решта - з темпом rate
+    return max(0, requests_count - burst) / rate if rate else 0.0
+
+
+class DownloadPlanner:
+    """Оцінка завантаження моделі/версії без передачі зображень.
+
+    Обходить сторінки API конвеєром і рахує зображення за результатом:
+    відфільтровані, вже наявні, пов'язані зі сховища і нові. З head розміри
+    нових зображень дізнаються HEAD-запитами.
+    """
+
+    def __init__(self, pipeline, head=False):
+        self.pipeline = pipeline
+        self.head = head
+
+    def run(self):
+        pipeline = self.pipeline
+        with pipeline.resources():
+            if pipeline.sync:
+                pipeline.load_sync_mark()
+            with ThreadPoolExecutor(max_workers=pipeline.workers) as pool:
+                job = self._walk(pool)
+        return job
+
+    def _walk(self, pool):
+        pipeline = self.pipeline
+        headers = pipeline.build_headers()
+        params = pipeline.build_params()
+        model_dir = pipeline.model_dir()
+        job = {"model_id": str(pipeline.model_id), "model_version_id": str(pipeline.model_version_id or ""),
+               "params": params, "pages": 0, "seen": 0, "filtered": 0, "known": 0, "linked": 0,
+               "items": [], "sizes": {}, "completed": False, "output": pipeline.output}
+        sizes = {}
+        next_page_url = None
+        while pipeline.is_running():
+            limit = pipeline.next_page_limit()
+            if not limit:
+                job["completed"] = True
+                break
+            url, page_params = pipeline.page_request(next_page_url, params, limit)
+            started = time.perf_counter()
+            data = pipeline.fetch_page(url, headers, page_params)
+            if data is None:
+                break
+            pipeline.metrics.observe("api_page", time.perf_counter() - started)
+            items = data.get("items", [])
+            next_page_url = data.get("metadata", {}).get("nextPage") if items else None
+            if pipeline.sync:
+                items, reached_mark = pipeline.newer_than_mark(items)
+                if reached_mark:
+                    next_page_url = None
+            job["pages"] += 1
+            items, rejected, cut = pipeline.admit(items)
+            job["seen"] += len(items) + rejected
+            job["filtered"] += rejected
+            for item in self._unknown(items, model_dir, job):
+                job["items"].append(item)
+                if self.head and item.get("id") is not None:
+                    sizes[item["id"]] = pool.submit(self._content_length, item)
+            pipeline.log(f"План: сторінка {job['pages']}, зображень {job['seen']}, "
+                         f"до завантаження {len(job['items']) - job['linked']}")
+            if not next_page_url or cut:
+                job["completed"] = True
+                break
+
+        for image_id, future in sizes.items():
+            size = future.result()
+            if size is not None:
+                job["sizes"][str(image_id)] = size
+        return job
+
+    def _unknown(self, items, model_dir, job):
+        # Та сама перевірка, що й filter_known конвеєра, але без побічних дій
+        pipeline = self.pipeline
+        ids = [int(item["id"]) for item in items if item.get("id") is not None]
+        known = pipeline.index.known_ids(ids, pipeline.model_id, pipeline.model_version_id) if ids else set()
+        elsewhere = set()
+        if pipeline.store is not None and ids:
+            elsewhere = set(pipeline.index.records([i for i in ids if i not in known]))
+        remaining = []
+        for item in items:
+            if not item.get("url"):
+                continue
+            image_id = int(item["id"]) if item.get("id") is not None else None
+            # Файли, завантажені до появи індексу, теж не завантажуються знову
+            image_name = os.path.basename(urlparse(item["url"]).path)
+            if image_id in known or os.path.exists(os.path.join(model_dir, image_name)):
+                job["known"] += 1
+                continue
+            if image_id in elsewhere:
+                job["linked"] += 1
+            remaining.append(item)
+        return remaining
+
+    def _content_length(self, item):
+        try:
+            response = self.pipeline.request(self.pipeline.request_url(item), method="HEAD", allow_redirects=True)
+        except requests.RequestException:
+            # Розмір лишається невідомим і оцінюється за середнім
+            return None
+        if response is None:
+            return None
+        response.close()
+        length = response.headers.get("Content-Length")
+        if response.status_code != 200 or not length or not length.isdigit():
+            return None
+        return int(length)
+
+
+def build_manifest(jobs, download_folder, rate_limiter, average_size=None):
+    """Маніфест плану: завдання з елементами API, підсумки та оцінка часу.
+
+    Розмір зображень без HEAD-відповіді оцінюється за середнім з отриманих
+    відповідей, а без них - за average_size (середнє з індексу).
+    """
+    totals = {"pages": 0, "seen": 0, "filtered": 0, "known": 0, "linked": 0, "download": 0,
+              "sized": 0, "bytes": 0}
+    for job in jobs:
+        for key in ("pages", "seen", "filtered", "known", "linked"):
+            totals[key] += job[key]
+        totals["download"] += len(job["items"]) - job["linked"]
+        totals["sized"] += len(job["sizes"])
+        totals["bytes"] += sum(job["sizes"].values())
+    if totals["sized"]:
+        average_size = totals["bytes"] / totals["sized"]
+    if average_size:
+        totals["estimated_bytes"] = round(totals["bytes"] + average_size * max(0, totals["download"] - totals["sized"]))
+    else:
+        totals["estimated_bytes"] = None
+    # Повний запуск ще раз проходить сторінки API, виконання маніфесту - ні
+    totals["estimated_seconds"] = round(estimate_seconds(
+        totals["pages"] + totals["download"], rate_limiter.max_rate, rate_limiter.burst), 1)
+    totals["manifest_seconds"] = round(estimate_seconds(
+        totals["download"], rate_limiter.max_rate, rate_limiter.burst), 1)
+    return {"version": MANIFEST_VERSION, "created_at": time.time(), "download_folder": download_folder,
+            "rate_limit": rate_limiter.max_rate, "rate_burst": rate_limiter.burst,
+            "totals": totals, "jobs": jobs}
+
+
+def format_report(manifest):
+    totals = manifest["totals"]
+    lines = []
+    for job in manifest["jobs"]:
+        label = job["model_id"] + (f"/{job['model_version_id']}" if job["model_version_id"] else "")
+        lines.append(f"Модель {label}: сторінок {job['pages']}, зображень {job['seen']}, "
+                     f"відфільтровано {job['filtered']}, вже завантажено {job['known']}, "
+                     f"буде пов'язано {job['linked']}, до завантаження {len(job['items']) - job['linked']}"
+                     + ("" if job["completed"] else " (обхід не завершено)"))
+    lines.append(f"Разом до завантаження: {totals['download']} зображень, "
+                 f"вже завантажено: {totals['known']}, відфільтровано: {totals['filtered']}")
+    if totals["estimated_bytes"] is None:
+        lines.append("Обсяг: невідомий (немає HEAD-відповідей і завантажених зображень в індексі)")
+    else:
+        lines.append(f"Обсяг: ~{totals['estimated_bytes'] / 1048576:.1f} МБ "
+                     f"(точний розмір відомий для {totals['sized']} зображень)")
+    lines.append(f"Час за ліміту {manifest['rate_limit']}/с: не менше "
+                 f"{format_duration(totals['estimated_seconds'])}, за маніфестом - "
+                 f"{format_duration(totals['manifest_seconds'])}")
+    return lines
+
+
+def write_manifest(manifest, path):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Непідтримувана версія маніфесту: {manifest.get('version')}")
+    return manifest
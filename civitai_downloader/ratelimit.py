@@ -0,0 +1,93 @@
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Коди відповіді, якими сервер просить зменшити швидкість запитів
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Повертає затримку з заголовка Retry-After у секундах або None."""
+    if not value:
+        return None
+    value = value.strip()
+    # RFC 9110 задає цілі секунди, але деякі сервери надсилають дробові ("0.5")
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return seconds if 0 <= seconds < float("inf") else None
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Token bucket з AIMD-регулюванням швидкості.
+
+    Поки сервер відповідає успішно, швидкість адитивно зростає до rate;
+    на 429/503 вона мультиплікативно зменшується, а всі запити чекають
+    стільки, скільки вказано в Retry-After. Один екземпляр можна спільно
+    використовувати з кількох потоків.
+    """
+
+    def __init__(self, rate=2.0, burst=4, min_rate=0.1, increase=None, decrease=0.5):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.min_rate = min(float(min_rate), self.max_rate)
+        # За замовчуванням повне відновлення швидкості займає ~20 успішних запитів
+        self.increase = increase if increase is not None else self.max_rate / 20
+        self.decrease = decrease
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Під час паузи після 429/503 токени не накопичуються
+        if now < self._updated:
+            return
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    def acquire(self, stop_event=None):
+        """Чекає на вільний токен. Повертає False, якщо очікування перервано."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                else:
+                    delay = (1 - self.tokens) / self.rate
+
+            if stop_event is not None:
+                if stop_event.wait(min(delay, 0.5)):
+                    return False
+            else:
+                time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = 0.0
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self._blocked_until = max(self._blocked_until, now + pause)
+            self._updated = self._blocked_until
+            return pause
@@ -0,0 +1,38 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Помилки сервера, які повторюються з експоненційною затримкою.
+# 429 і 503 сюди не входять: на них реагує RateLimiter.
+RETRY_STATUS_CODES = (500, 502, 504)
+
+# (з'єднання, читання) у секундах: без тайм-ауту завислий сокет назавжди
+# займає потік пулу, а повтори читання urllib3 ніколи не спрацьовують
+DEFAULT_TIMEOUT = (10, 60)
+
+
+def create_session(pool_maxsize=10, retries=3, backoff_factor=0.5, pool_connections=4):
+    """Створює спільну сесію requests з пулом з'єднань і повторами.
+
+    Помилки з'єднання та відповіді 5xx повторюються до retries разів.
+    Сесію можна використовувати з кількох потоків.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+        # Інакше urllib3 сам повторює 429/503 з Retry-After, і RateLimiter
+        # не дізнається про обмеження
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=retry, pool_block=True)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,59 @@
+import os
+import json
+
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "civitai_settings.json")
+
+# Значення за замовчуванням для ключів, яких немає у файлі налаштувань
+DEFAULT_SETTINGS = {
+    "download_folder": "",
+    "api_key": "",
+    "model_id": "",
+    "model_version_id": "",
+    "image_limit": 100,  # Загальна кількість зображень моделі/версії; 0 - без обмеження
+    "page_size": 200,  # Зображень на сторінку API (найбільше 200)
+    "nsfw": "X",
+    "max_image_size": 0,  # Найбільша сторона варіанта з CDN, px; 0 - оригінал
+    "workers": 4,
+    "rate_limit": 2.0,
+    "rate_burst": 4,
+    "resume": False,
+    "sync": False,  # Лише нові зображення з часу останньої синхронізації
+    "prefetch_pages": 2,
+    "pool_maxsize": 0,  # 0 - визначається кількістю потоків
+    "http_retries": 3,
+    "http_backoff": 0.5,
+    "http_timeout": [10, 60],  # Тайм-аут з'єднання і читання, с
+    "page_cache_ttl": 3600,  # Скільки секунд сторінка API береться з кешу; 0 - без кешу
+    "page_cache_mb": 256,
+    "parallel_jobs": 2,
+    "dedup": True,
+    "link_mode": "hardlink",  # hardlink, reflink або copy
+    "plan_head": False,  # План (--plan) дізнається розміри зображень HEAD-запитами
+    "lease_ttl": 300,  # Секунд оренди одиниці роботи в розподіленому режимі (--ledger)
+    "metrics_log": True,  # civitai_metrics.jsonl у папці завантаження
+    "prompt_files": True,  # .txt з підказкою поруч із кожним зображенням
+    "sort": "Most Reactions",  # Most Reactions, Most Comments або Newest
+    "period": "",  # AllTime, Year, Month, Week, Day; порожньо - на розсуд API
+    # Правила ImageFilter: min_width, min_height, min_reactions, nsfw_levels,
+    # created_after, created_before, include, exclude, media_types
+    "filters": {},
+    "output": "files",  # files або shards (tar-шарди WebDataset)
+    "shard_size_mb": 1024,
+    # Перетворення після завантаження (потрібен Pillow): format (webp, jpeg,
+    # png), quality, max_size, thumbnail_size, thumbnail_format, processes
+    "transcode": {},
+}
+
+
+def load_settings(path=SETTINGS_FILE):
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            settings.update(json.load(f))
+    return settings
+
+
+def save_settings(settings, path=SETTINGS_FILE):
+    # Відсутні ключі записуються зі значеннями за замовчуванням
+    with open(path, 'w') as f:
+        json.dump(dict(DEFAULT_SETTINGS, **settings), f)
@@ -0,0 +1,131 @@
+import io
+import os
+import re
+import json
+import time
+import tarfile
+import threading
+
+SHARD_INDEX_FILENAME = "civitai_shards.jsonl"
+SHARD_NAME = "shard-{:06d}.tar"
+SHARD_RE = re.compile(r"shard-(\d{6})\.tar(\.part)?$")
+
+DEFAULT_SHARD_BYTES = 1024 * 1048576
+
+# Кінець архіву tar - два порожні блоки по 512 байт
+TAR_END = b"\0" * (2 * tarfile.BLOCKSIZE)
+
+
+def padded(size):
+    # Розмір даних файлу в tar з доповненням до цілого блоку
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+class ShardWriter:
+    """Запис зображень і метаданих у tar-шарди у форматі WebDataset.
+
+    Новий шард починається, коли наступний зразок перевищив би max_bytes.
+    Зміщення файлів кожного зразка дописуються в civitai_shards.jsonl.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_SHARD_BYTES):
+        self.directory = directory
+        self.max_bytes = max(1, int(max_bytes))
+        self.index_path = os.path.join(directory, SHARD_INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._tar = None
+        self._file = None
+        self._name = None
+        os.makedirs(directory, exist_ok=True)
+        self._next_number = self._recover()
+
+    @classmethod
+    def for_model_dir(cls, model_dir, max_bytes=DEFAULT_SHARD_BYTES):
+        return cls(model_dir, max_bytes)
+
+    def _recover(self):
+        # Закриває незавершені шарди і повертає номер наступного
+        ends = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    ends[record["shard"]] = max(ends.get(record["shard"], 0), record["end"])
+        last = -1
+        for name in sorted(os.listdir(self.directory)):
+            match = SHARD_RE.match(name)
+            if not match:
+                continue
+            last = max(last, int(match.group(1)))
+            if match.group(2):
+                self._finish_part(os.path.join(self.directory, name), ends.get(name[:-len(".part")], 0))
+        return last + 1
+
+    @staticmethod
+    def _finish_part(part_path, end):
+        if not end:
+            os.remove(part_path)
+            return
+        with open(part_path, "r+b") as f:
+            f.truncate(end)
+            f.seek(end)
+            f.write(TAR_END)
+        os.replace(part_path, part_path[:-len(".part")])
+
+    def _open_shard(self):
+        self._name = SHARD_NAME.format(self._next_number)
+        self._next_number += 1
+        self._file = open(os.path.join(self.directory, self._name + ".part"), "wb")
+        self._tar = tarfile.open(fileobj=self._file, mode="w", format=tarfile.USTAR_FORMAT)
+
+    def _close_shard(self):
+        if self._tar is None:
+            return
+        self._tar.close()
+        self._file.close()
+        path = os.path.join(self.directory, self._name)
+        os.replace(path + ".part", path)
+        self._tar = self._file = self._name = None
+
+    def add(self, key, members):
+        """Дописує зразок key; members - пари (розширення, bytes або шлях до файлу).
+
+        Повертає ім'я шарду, в який потрапив зразок.
+        """
+        sizes = [len(data) if isinstance(data, bytes) else os.path.getsize(data) for _, data in members]
+        sample_bytes = sum(tarfile.BLOCKSIZE + padded(size) for size in sizes)
+        with self._lock:
+            if self._tar is not None and self._tar.offset and self._tar.offset + sample_bytes > self.max_bytes:
+                self._close_shard()
+            if self._tar is None:
+                self._open_shard()
+
+            start = self._tar.offset
+            offsets = {}
+            for (extension, data), size in zip(members, sizes):
+                info = tarfile.TarInfo(f"{key}.{extension}")
+                info.size = size
+                info.mtime = time.time()
+                info.mode = 0o644
+                if isinstance(data, bytes):
+                    self._tar.addfile(info, io.BytesIO(data))
+                else:
+                    with open(data, "rb") as f:
+                        self._tar.addfile(info, f)
+                # Дані файлу - останні padded(size) байт перед поточною позицією
+                offsets[extension] = [self._tar.offset - padded(size), size]
+            self._file.flush()
+
+            # Зразок вважається записаним лише після рядка в індексі
+            record = {"key": key, "shard": self._name, "offset": start,
+                      "end": self._tar.offset, "members": offsets}
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            return self._name
+
+    def close(self):
+        with self._lock:
+            self._close_shard()
@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+# Розмір частини, якою тіло відповіді читається з мережі та пишеться на диск
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class PartialDownload:
+    """Незавершене завантаження файлу path.
+
+    Дані пишуться частинами у <path>.part, а поруч у журналі <path>.part.json
+    зберігаються URL, ETag і повний розмір файлу. Якщо передачу перервано
+    (зупинка або збій), наступний запуск продовжує її запитом з Range,
+    перевіряючи ETag і розмір. Після повного завантаження .part атомарно
+    перейменовується в path, тож неповний файл ніколи не має кінцевого імені.
+    """
+
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.part_path = path + ".part"
+        self.journal_path = self.part_path + ".json"
+        self.journal = self._load_journal()
+        self.sha256 = None
+        # Час, витрачений на запис частин на диск (без очікування мережі)
+        self.write_time = 0.0
+
+    def _load_journal(self):
+        try:
+            with open(self.journal_path, 'r') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Частина від іншого URL не може бути продовжена
+        if journal.get("url") != self.url:
+            return {}
+        return journal
+
+    def _save_journal(self):
+        with open(self.journal_path, 'w') as f:
+            json.dump(self.journal, f)
+
+    @property
+    def offset(self):
+        if not self.journal:
+            return 0
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def request_headers(self):
+        # Заголовки для продовження з місця зупинки; If-Range змушує сервер
+        # віддати весь файл, якщо він змінився
+        offset = self.offset
+        if not offset:
+            return {}
+        headers = {"Range": f"bytes={offset}-"}
+        if self.journal.get("etag"):
+            headers["If-Range"] = self.journal["etag"]
+        return headers
+
+    def _resumes(self, response, offset):
+        match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+        if not match or int(match.group(1)) != offset:
+            return False
+        expected = self.journal.get("content_length")
+        total = match.group(3)
+        return expected is None or total == "*" or int(total) == expected
+
+    @staticmethod
+    def _total_length(response):
+        if response.status_code == 206:
+            match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+            if match and match.group(3) != "*":
+                return int(match.group(3))
+            return None
+        length = response.headers.get("Content-Length")
+        return int(length) if length and length.isdigit() else None
+
+    def write(self, response, chunk_size=CHUNK_SIZE, is_running=None):
+        """Пише тіло відповіді 200/206 у .part файл.
+
+        Повертає повний розмір файлу після завершення або None, якщо
+        завантаження зупинено (частина та журнал залишаються для продовження).
+        SHA-256 вмісту рахується під час запису і доступний як self.sha256.
+        """
+        digest = hashlib.sha256()
+        try:
+            offset = self.offset
+            if response.status_code != 206:
+                mode = "wb"
+            elif offset and self._resumes(response, offset):
+                mode = "ab"
+                self._hash_file(digest, self.part_path)
+            else:
+                # Діапазон не збігається зі збереженою частиною
+                self.discard()
+                raise IOError(f"Неочікуваний Content-Range для {self.url}")
+            self.journal = {
+                "url": self.url,
+                "etag": response.headers.get("ETag") or (self.journal.get("etag") if mode == "ab" else None),
+                "content_length": self._total_length(response),
+            }
+            self._save_journal()
+
+            with open(self.part_path, mode) as part_file:
+                for chunk in response.iter_content(chunk_size):
+                    if is_running is not None and not is_running():
+                        return None
+                    started = time.perf_counter()
+                    part_file.write(chunk)
+                    self.write_time += time.perf_counter() - started
+                    digest.update(chunk)
+        finally:
+            response.close()
+
+        size = os.path.getsize(self.part_path)
+        expected = self.journal["content_length"]
+        if expected is not None and size != expected:
+            raise IOError(f"Неповне завантаження {self.url}: {size} з {expected} байт")
+        self.sha256 = digest.hexdigest()
+        return size
+
+    @staticmethod
+    def _hash_file(digest, path, chunk_size=CHUNK_SIZE):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+
+    def finish(self):
+        os.replace(self.part_path, self.path)
+        self._remove(self.journal_path)
+
+    def discard(self):
+        self._remove(self.part_path)
+        self._remove(self.journal_path)
+        self.journal = {}
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+import multiprocessing
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+
+# Формат -> (назва формату Pillow, розширення файлу)
+FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+    "png": ("PNG", "png"),
+}
+
+# Файли, які Pillow може відкрити; відео та інше пропускаються
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+TRANSCODE_KEYS = ("format", "quality", "max_size", "thumbnail_size", "thumbnail_format", "processes")
+
+
+def pillow_available():
+    return importlib.util.find_spec("PIL") is not None
+
+
+def _save(image, path, fmt, quality):
+    pillow_format = FORMATS[fmt][0]
+    if pillow_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    temp_path = path + ".tmp"
+    image.save(temp_path, format=pillow_format, quality=quality)
+    os.replace(temp_path, path)
+
+
+def _source_format(extension):
+    # Ключ FORMATS для розширення файлу або None
+    extension = extension.lower()[1:]
+    for fmt, (_, format_extension) in FORMATS.items():
+        if extension in (fmt, format_extension):
+            return fmt
+    return None
+
+
+def transcode_image(path, fmt=None, quality=90, max_size=0, thumbnail_size=0, thumbnail_format="jpeg"):
+    """Перетворює і зменшує зображення path та створює мініатюру поруч із ним.
+
+    Виконується в процесі пулу. Повертає (список створених файлів, час у с).
+    Оригінал не змінюється: у ньому може бути жорстке посилання на файл
+    сховища, тож зменшена копія без зміни формату зберігається окремо як
+    <ім'я>.resized.<розширення>.
+    """
+    from PIL import Image
+
+    started = time.perf_counter()
+    written = []
+    stem, extension = os.path.splitext(path)
+    source_format = _source_format(extension)
+    with Image.open(path) as image:
+        image.load()
+        oversized = max_size and max(image.size) > max_size
+        # Файл, уже збережений у цьому форматі, перетворюється лише для зменшення
+        if fmt and fmt != source_format:
+            target = f"{stem}.{FORMATS[fmt][1]}"
+        elif oversized and (fmt or source_format):
+            fmt = fmt or source_format
+            target = f"{stem}.resized{extension}"
+        else:
+            target = None
+        if target:
+            converted = image.copy()
+            if max_size:
+                converted.thumbnail((max_size, max_size))
+            _save(converted, target, fmt, quality)
+            written.append(target)
+        if thumbnail_size:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+            target = f"{stem}.thumb.{FORMATS[thumbnail_format][1]}"
+            _save(thumbnail, target, thumbnail_format, quality)
+            written.append(target)
+    return written, time.perf_counter() - started
+
+
+class Transcoder:
+    """Перетворення та мініатюри зображень у пулі процесів.
+
+    Параметри задає словник налаштувань "transcode". Потрібен Pillow.
+    """
+
+    def __init__(self, fmt=None, quality=90, max_size=0, thumbnail_size=0,
+                 thumbnail_format="jpeg", processes=0):
+        if not pillow_available():
+            raise ImportError("Для перетворення зображень потрібен Pillow: pip install Pillow")
+        for name in (fmt, thumbnail_format):
+            if name and name not in FORMATS:
+                raise ValueError(f"Невідомий формат зображення: {name}")
+        self.options = dict(fmt=fmt or None, quality=int(quality), max_size=int(max_size or 0),
+                            thumbnail_size=int(thumbnail_size or 0), thumbnail_format=thumbnail_format)
+        # spawn: процеси пулу запускаються з потоків завантаження, а fork
+        # багатопотокового процесу може заблокуватись
+        self._pool = ProcessPoolExecutor(max_workers=processes or None,
+                                         mp_context=multiprocessing.get_context("spawn"))
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, options):
+        """Створює Transcoder з налаштувань або повертає None, якщо нічого робити."""
+        options = dict(options or {})
+        unknown = set(options) - set(TRANSCODE_KEYS)
+        if unknown:
+            raise ValueError(f"Невідомі параметри перетворення: {', '.join(sorted(unknown))}")
+        if not options.get("format") and not options.get("thumbnail_size") and not options.get("max_size"):
+            return None
+        options["fmt"] = options.pop("format", None)
+        return cls(**options)
+
+    def submit(self, path, log=print, metrics=None):
+        if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS:
+            return None
+        future = self._pool.submit(transcode_image, path, **self.options)
+        with self._lock:
+            self._pending.add(future)
+
+        def done(future):
+            with self._lock:
+                self._pending.discard(future)
+            if future.cancelled():
+                return
+            try:
+                _, seconds = future.result()
+            except Exception as e:
+                log(f"Не вдалося перетворити {os.path.basename(path)}: {e}")
+                return
+            if metrics is not None:
+                metrics.add("transcoded")
+                metrics.observe("transcode", seconds)
+
+        future.add_done_callback(done)
+        return future
+
+    def close(self, cancel=False):
+        # Без cancel чекаємо, поки пул обробить усі передані зображення
+        if cancel:
+            with self._lock:
+                pending = list(self._pending)
+            for future in pending:
+                future.cancel()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,311 @@
+import io
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from civitai_downloader.storage import CHUNK_SIZE
+from civitai_downloader.session import DEFAULT_TIMEOUT
+from civitai_downloader.content_store import ContentStore, STORE_DIRNAME
+from civitai_downloader.metadata import MetadataStore
+from civitai_downloader.shards import SHARD_INDEX_FILENAME, SHARD_RE
+from civitai_downloader.transcode import pillow_available
+
+REPAIR_FILENAME = "civitai_repair.json"
+
+# Файли, які перевіряються при обході папки завантаження
+MEDIA_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".mp4", ".webm")
+
+# Типи, які вміє декодувати Pillow; відео перевіряються лише за заголовком
+DECODE_KINDS = ("png", "jpeg", "webp", "gif")
+
+PROBLEMS = {
+    "missing": "файл відсутній",
+    "empty": "порожній файл",
+    "size": "розмір не збігається",
+    "header": "невідомий заголовок",
+    "truncated": "файл обрізано",
+    "hash": "SHA-256 не збігається",
+    "decode": "не декодується",
+}
+
+# Скільки байт з кінця файлу читається для перевірки ознаки кінця
+TAIL_SIZE = 64
+
+
+def sniff(head):
+    """Визначає тип файлу за першими байтами; None - невідомий."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    return None
+
+
+def _complete(kind, head, tail, length):
+    # Ознака кінця файлу там, де формат її має
+    if kind == "png":
+        return b"IEND" in tail[-12:]
+    if kind == "jpeg":
+        return b"\xff\xd9" in tail
+    if kind == "webp":
+        return int.from_bytes(head[4:8], "little") + 8 <= length
+    if kind == "gif":
+        return tail.rstrip(b"\0").endswith(b";")
+    return True
+
+
+def check_file(task):
+    """Перевіряє файл або член tar-шарду; повертає ключ PROBLEMS або None.
+
+    Виконується в процесі пулу. Спершу дешеві перевірки (розмір,
+    заголовок, ознака кінця), з full - ще SHA-256 і декодування Pillow.
+    """
+    path, offset = task["path"], task["offset"]
+    try:
+        length = task["length"] if task["length"] is not None else os.path.getsize(path)
+        f = open(path, "rb")
+    except OSError:
+        return "missing"
+    with f:
+        if task["size"] is not None and length != task["size"]:
+            return "size"
+        if not length:
+            return "empty"
+        f.seek(offset)
+        head = f.read(16)
+        kind = sniff(head)
+        if kind is None:
+            return "header"
+        f.seek(offset + max(0, length - TAIL_SIZE))
+        tail = f.read(min(TAIL_SIZE, length))
+        if len(tail) < min(TAIL_SIZE, length) or not _complete(kind, head, tail, length):
+            return "truncated"
+        if not task["full"]:
+            return None
+
+        f.seek(offset)
+        digest = hashlib.sha256()
+        data = None
+        if task["decode"] and kind in DECODE_KINDS:
+            # Зображення читається один раз і для хешу, і для декодування
+            data = f.read(length)
+            digest.update(data)
+        else:
+            remaining = length
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+    if task["sha256"] and digest.hexdigest() != task["sha256"]:
+        return "hash"
+    if data is not None:
+        from PIL import Image
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+        except Exception:
+            return "decode"
+    return None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Verifier:
+    """Перевірка цілісності дерева завантажень у пулі процесів.
+
+    Файли та зразки шардів звіряються з індексом (розмір, SHA-256) і
+    форматом. repair повертає завдання маніфесту для повторного
+    завантаження пошкоджених файлів.
+    """
+
+    def __init__(self, download_folder, index, full=True, processes=0, log=print,
+                 session=None, rate_limiter=None, timeout=DEFAULT_TIMEOUT):
+        self.download_folder = download_folder
+        self.index = index
+        self.full = full
+        self.processes = processes
+        self.log = log
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.timeout = tuple(timeout)
+        self._shard_records = {}
+
+    def _model_dir(self, model_id, model_version_id):
+        model_dir = os.path.join(self.download_folder, str(model_id))
+        if model_version_id:
+            model_dir = os.path.join(model_dir, str(model_version_id))
+        return model_dir
+
+    def _shard_index(self, model_dir):
+        # Останній запис для кожного ключа, як і при читанні шардів
+        if model_dir not in self._shard_records:
+            records = {}
+            try:
+                with open(os.path.join(model_dir, SHARD_INDEX_FILENAME), "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        records[record["key"]] = record
+            except OSError:
+                pass
+            self._shard_records[model_dir] = records
+        return self._shard_records[model_dir]
+
+    def _locate(self, path):
+        # Шлях у шарді має вигляд <модель>/<версія>/<шард>/<ім'я файлу>
+        shard_dir = os.path.dirname(path)
+        match = SHARD_RE.match(os.path.basename(shard_dir))
+        if not match or match.group(2):
+            return {"file": os.path.join(self.download_folder, path), "offset": 0, "length": None, "shard": False}
+        model_dir = os.path.join(self.download_folder, os.path.dirname(shard_dir))
+        key, extension = os.path.splitext(os.path.basename(path))
+        record = self._shard_index(model_dir).get(key)
+        member = record["members"].get(extension[1:].lower() or "jpg") if record else None
+        if member is None:
+            return {"file": None, "offset": 0, "length": None, "shard": True}
+        return {"file": os.path.join(model_dir, record["shard"]), "offset": member[0],
+                "length": member[1], "shard": True}
+
+    def entries(self, model_id=None, model_version_id=""):
+        """Збирає файли для перевірки: розміщення з індексу та файли поза індексом."""
+        entries = []
+        for placement in self.index.placements(model_id, model_version_id):
+            entries.append(dict(placement, **self._locate(placement["path"])))
+
+        # Файли інших версій моделі теж можуть лежати під root
+        indexed = {os.path.normpath(os.path.join(self.download_folder, placement["path"]))
+                   for placement in self.index.placements()}
+        root = self._model_dir(model_id, model_version_id) if model_id else self.download_folder
+        for directory, dirs, files in os.walk(root):
+            # Сховище перевіряється через посилання на нього з папок моделей
+            dirs[:] = [name for name in dirs if name != STORE_DIRNAME]
+            for name in files:
+                path = os.path.join(directory, name)
+                if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS and os.path.normpath(path) not in indexed:
+                    entries.append({"id": None, "path": os.path.relpath(path, self.download_folder),
+                                    "url": None, "size": None, "sha256": None, "file": path,
+                                    "offset": 0, "length": None, "shard": False})
+        return entries
+
+    def remote_sizes(self, entries, workers=8):
+        """Для записів без хешу бере очікуваний розмір з Content-Length сервера."""
+        targets = [entry for entry in entries if entry["id"] is not None and not entry["sha256"] and entry["url"]]
+
+        def head(entry):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.head(entry["url"], allow_redirects=True, timeout=self.timeout)
+            except Exception as e:
+                self.log(f"Не вдалося отримати розмір {entry['path']}: {e}")
+                return
+            response.close()
+            length = response.headers.get("Content-Length")
+            if response.status_code == 200 and length and length.isdigit():
+                entry["size"] = int(length)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(head, targets))
+        return len(targets)
+
+    def run(self, entries):
+        """Перевіряє entries у пулі процесів і повертає пошкоджені з ключем problem."""
+        decode = self.full and pillow_available()
+        if self.full and not decode:
+            self.log("Pillow не встановлено: зображення перевіряються без декодування.")
+        broken = []
+        checked = [entry for entry in entries if entry["file"]]
+        for entry in entries:
+            if not entry["file"]:
+                entry["problem"] = "missing"
+                broken.append(entry)
+        tasks = [{"path": entry["file"], "offset": entry["offset"], "length": entry["length"],
+                  "size": entry["size"], "sha256": entry["sha256"], "full": self.full, "decode": decode}
+                 for entry in checked]
+        # spawn, як і в пулі перетворень: без копії стану батьківського процесу
+        with ProcessPoolExecutor(max_workers=self.processes or None,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = pool.map(check_file, tasks, chunksize=32)
+            for number, (entry, problem) in enumerate(zip(checked, results), 1):
+                if problem:
+                    entry["problem"] = problem
+                    broken.append(entry)
+                    self.log(f"Пошкоджено ({PROBLEMS[problem]}): {entry['path']}")
+                if number % 1000 == 0:
+                    self.log(f"Перевірено файлів: {number} з {len(checked)}")
+        return broken
+
+    def format_summary(self, entries, broken):
+        indexed = sum(entry["id"] is not None for entry in entries)
+        lines = [f"Перевірено файлів: {len(entries)} (з індексу {indexed}), пошкоджено: {len(broken)}"]
+        counts = {}
+        for entry in broken:
+            counts[entry["problem"]] = counts.get(entry["problem"], 0) + 1
+        for problem, count in sorted(counts.items()):
+            lines.append(f"  {PROBLEMS[problem]}: {count}")
+        unindexed = sum(entry["id"] is None for entry in broken)
+        if unindexed:
+            lines.append(f"Пошкоджених файлів поза індексом (не відновлюються автоматично): {unindexed}")
+        return lines
+
+    def _remove_blob(self, entry):
+        # Посилання на пошкоджений вміст сховища: інакше нове завантаження
+        # вважалося б дублікатом і знову пов'язувалось би з ним
+        store = ContentStore.for_folder(self.download_folder)
+        blob = store.blob_path(entry["sha256"], os.path.splitext(entry["file"])[1])
+        if not os.path.exists(blob):
+            return
+        linked = os.path.exists(entry["file"]) and os.path.samefile(blob, entry["file"])
+        if linked or file_sha256(blob) != entry["sha256"]:
+            os.remove(blob)
+
+    def repair(self, broken):
+        """Видаляє пошкоджені файли, забуває їх в індексі і повертає завдання маніфесту.
+
+        Елементи API беруться з civitai_metadata.jsonl моделі/версії, а за
+        його відсутності - URL з індексу. Зразки в tar-шардах лишаються в
+        шарді, повторне завантаження дописує новий зразок з тим самим ключем.
+        """
+        jobs = {}
+        metadata = {}
+        for entry in broken:
+            if entry["id"] is None:
+                continue
+            if entry["sha256"]:
+                self._remove_blob(entry)
+            if not entry["shard"] and os.path.exists(entry["file"]):
+                os.remove(entry["file"])
+            self.index.forget(entry["id"], entry["model_id"], entry["model_version_id"])
+
+            model_dir = self._model_dir(entry["model_id"], entry["model_version_id"])
+            if model_dir not in metadata:
+                metadata[model_dir] = MetadataStore.for_model_dir(model_dir).records()
+            item = dict(metadata[model_dir].get(entry["id"]) or {"id": entry["id"], "url": entry["url"]})
+            item.pop("file", None)
+            job = jobs.setdefault((entry["model_id"], entry["model_version_id"]), {
+                "model_id": entry["model_id"], "model_version_id": entry["model_version_id"],
+                "params": {}, "pages": 0, "seen": 0, "filtered": 0, "known": 0, "linked": 0,
+                "items": [], "sizes": {}, "completed": True,
+                "output": "shards" if entry["shard"] else "files"})
+            job["items"].append(item)
+            job["seen"] += 1
+        return list(jobs.values())
@@ -1,17 +1,27 @@
 import sys
 import os
-import requests
 import time
-import random
 import webbrowser
 import json
-from urllib.parse import urlparse, parse_qsl
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
                            QLabel, QLineEdit, QPushButton, QFileDialog,
                            QMessageBox, QDesktopWidget, QTextEdit, QProgressBar,
                            QSpinBox, QCheckBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon
+from civitai_downloader.settings import SETTINGS_FILE, DEFAULT_SETTINGS, load_settings, save_settings
+from civitai_downloader.cli import build_options, close_options
+from civitai_downloader.pipeline import DownloadPipeline
+from civitai_downloader.jobs import JobQueue, BatchRunner, parse_job_list
+from civitai_downloader.index import DownloadIndex
+from civitai_downloader.planner import (PLAN_FILENAME, DownloadPlanner, build_manifest,
+                                        format_report, write_manifest)
+
+# Скільки рядків зберігає лог у вікні (старіші видаляються)
+LOG_MAX_LINES = 2000
+# Як часто накопичені повідомлення та прогрес передаються у вікно, мс
+LOG_FLUSH_INTERVAL_MS = 200
 
 # Клас для виконання завантаження в окремому потоці
 class DownloadThread(QThread):
@@ -20,15 +30,20 @@ class DownloadThread(QThread):
     finished_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
     
-    def __init__(self, api_key, model_id, model_version_id, download_folder, image_limit=100, nsfw='X'):
+    def __init__(self, settings, jobs=None, plan=False):
         QThread.__init__(self)
-        self.api_key = api_key
-        self.model_id = model_id
-        self.model_version_id = model_version_id
-        self.download_folder = download_folder
-        self.image_limit = image_limit
-        self.nsfw = nsfw
+        # Словник як у civitai_settings.json з поточними значеннями полів вікна
+        self.settings = settings
+        self.api_key = settings["api_key"]
+        self.model_id = settings["model_id"]
+        self.model_version_id = settings["model_version_id"]
+        self.download_folder = settings["download_folder"]
+        self.jobs = jobs or []  # Пари (model_id, model_version_id) для пакетного режиму
+        self.plan = plan  # Лише оцінка і маніфест, без завантаження зображень
         self.is_running = True
+        self.runner = None
+        # Повідомлення з потоків завантаження чекають тут на пакетну передачу
+        self._messages = deque(maxlen=LOG_MAX_LINES)
         
     def run(self):
         try:
@@ -39,100 +54,96 @@ class DownloadThread(QThread):
     
     def stop(self):
         self.is_running = False
+        if self.runner:
+            self.runner.stop()
+    
+    def log(self, message):
+        # Викликається з потоків завантаження; сигнал не надсилається на
+        # кожне повідомлення, їх забирає таймер вікна через flush_progress
+        self._messages.append(message)
+    
+    def flush_progress(self):
+        lines = []
+        while self._messages:
+            lines.append(self._messages.popleft())
+        if lines:
+            self.progress_signal.emit("\n".join(lines))
+    
+    def progress(self):
+        return self.runner.progress() if self.runner else None
     
     def download_images(self):
-        base_url = "https://civitai.com/api/v1/images"
-        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
-        params = {
-            "limit": self.image_limit,
-            "modelId": self.model_id,
-            "modelVersionId": self.model_version_id if self.model_version_id else None,
-            "nsfw": self.nsfw,
-            "sort": "Most Reactions"
-        }
-
-        # Видалити None значення з параметрів
-        params = {k: v for k, v in params.items() if v is not None}
-        next_page_url = None
-
-        while self.is_running:
-            url = next_page_url if next_page_url else base_url
-            self.progress_signal.emit(f"Запит до: {url}")
-            
-            response = requests.get(url, headers=headers, params=params if not next_page_url else {})
-            if response.status_code != 200:
-                self.progress_signal.emit(f"Помилка: {response.status_code} - {response.text}")
-                break
-
-            data = response.json()
-            items = data.get("items", [])
-
-            if not items:
-                self.progress_signal.emit("Більше немає зображень для завантаження.")
-                break
-
-            # Підготувати директорію
-            model_dir = os.path.join(self.download_folder, str(self.model_id))
-            os.makedirs(model_dir, exist_ok=True)
-
-            if self.model_version_id:
-                model_dir = os.path.join(model_dir, str(self.model_version_id))
-                os.makedirs(model_dir, exist_ok=True)
-
-            for item in items:
+        # Сесія, обмежувач, кеш сторінок, перетворення і метрики - як у консольній версії
+        settings = self.settings
+        options = build_options(settings, settings["workers"], self.download_folder,
+                                settings["parallel_jobs"])
+        options.update(image_limit=settings["image_limit"], nsfw=settings["nsfw"],
+                       resume=settings["resume"], log=self.log, is_running=lambda: self.is_running)
+        try:
+            if self.plan:
+                self.plan_download(options)
+            else:
+                self.run_download(options)
+        finally:
+            # Після зупинки черга перетворень не доробляється; підсумок метрик
+            # потрапляє в лог перед повідомленням про завершення
+            close_options(options, self.log, cancel=not self.is_running)
+    
+    def run_download(self, options):
+        if self.jobs:
+            # Пакетний режим: завдання додаються до збереженої черги
+            job_queue = JobQueue.for_folder(self.download_folder)
+            job_queue.add_many(self.jobs)
+            self.runner = BatchRunner(job_queue, self.api_key, self.download_folder,
+                                      parallel_jobs=self.settings["parallel_jobs"], **options)
+        else:
+            # Завантаження виконує спільний конвеєр, його лог іде в буфер повідомлень
+            self.runner = DownloadPipeline(
+                self.api_key, self.model_id, self.model_version_id,
+                self.download_folder, **options
+            )
+        self.runner.run()
+    
+    def plan_download(self, options):
+        # Оцінка без передачі зображень; маніфест виконується командою
+        # python -m civitai_downloader --manifest
+        index = DownloadIndex.for_folder(self.download_folder)
+        options = dict(options, index=index)
+        try:
+            planned = []
+            for model_id, model_version_id in self.jobs or [(self.model_id, self.model_version_id)]:
                 if not self.is_running:
                     break
-                    
-                image_url = item.get("url")
-                meta = item.get("meta") or {}
-                prompt = meta.get("prompt", "Підказка недоступна.")
-
-                if image_url:
-                    # Витягти ім'я файлу зображення
-                    parsed_url = urlparse(image_url)
-                    image_name = os.path.basename(parsed_url.path)
-                    image_path = os.path.join(model_dir, image_name)
-
-                    # Перевірити, чи зображення вже існує
-                    if os.path.exists(image_path):
-                        self.progress_signal.emit(f"Зображення вже існує, пропускаємо: {image_name}")
-                        continue
-
-                    # Завантажити зображення
-                    img_response = requests.get(image_url)
-                    if img_response.status_code == 200:
-                        with open(image_path, "wb") as img_file:
-                            img_file.write(img_response.content)
-                        self.progress_signal.emit(f"Завантажено зображення: {image_name}")
-
-                        # Зберегти підказку
-                        prompt_path = os.path.join(model_dir, f"{os.path.splitext(image_name)[0]}.txt")
-                        with open(prompt_path, "w", encoding="utf-8") as prompt_file:
-                            prompt_file.write(prompt)
-                        self.progress_signal.emit(f"Збережено підказку для: {image_name}")
-                    else:
-                        self.progress_signal.emit(f"Не вдалося завантажити зображення: {image_url}")
-
-                    # Випадкова затримка, щоб уникнути блокування сервера
-                    delay = random.randint(3, 8)  # Зменшено для тестування
-                    self.progress_signal.emit(f"Очікування {delay} секунд перед наступним завантаженням...")
-                    time.sleep(delay)
-
-            # Перейти до наступної сторінки, якщо доступно
-            next_page_url = data.get("metadata", {}).get("nextPage")
-            if not next_page_url:
-                break
+                pipeline = DownloadPipeline(self.api_key, model_id, model_version_id,
+                                            self.download_folder, **options)
+                planned.append(DownloadPlanner(pipeline, head=self.settings["plan_head"]).run())
+            manifest = build_manifest(planned, self.download_folder, options["rate_limiter"],
+                                      index.average_size())
+        finally:
+            index.close()
+        for line in format_report(manifest):
+            self.log(line)
+        path = os.path.join(self.download_folder, PLAN_FILENAME)
+        write_manifest(manifest, path)
+        self.log(f"Маніфест збережено: {path}")
 
 class DownloadApp(QWidget):
     def __init__(self):
         super().__init__()
+        # Налаштування без полів у вікні (ліміт запитів, кеш, фільтри тощо)
+        # беруться з civitai_settings.json і зберігаються назад без змін
+        self.settings = dict(DEFAULT_SETTINGS)
         self.download_folder = ""
         self.api_key = ""
         self.model_id = ""
         self.model_version_id = ""
-        self.image_limit = 100
+        self.image_limit = 100  # Загальна кількість зображень; 0 - без обмеження
         self.nsfw = 'X'  # За замовчуванням включено
-        self.settings_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "civitai_settings.json")
+        self.workers = 4
+        self.resume = False
+        self.sync = False  # Лише нові зображення з часу останньої синхронізації
+        self.batch_jobs = []  # Пакет пар (model_id, model_version_id)
+        self.settings_file = SETTINGS_FILE
         self.download_thread = None
         
         # Спочатку завантажуємо налаштування, потім ініціалізуємо інтерфейс
@@ -201,6 +212,19 @@ class DownloadApp(QWidget):
         version_layout.addWidget(version_label)
         version_layout.addWidget(self.version_input)
         
+        # Пакет моделей: список "model_id:version_id" через кому або з файлу
+        batch_layout = QHBoxLayout()
+        batch_label = QLabel('пакет моделей:')
+        self.batch_input = QLineEdit()
+        self.batch_input.setPlaceholderText('1022641:1523537, 12345')
+        self.batch_input.textChanged.connect(self.check_fields)
+        batch_file_button = QPushButton('Файл')
+        batch_file_button.clicked.connect(self.browse_batch_file)
+        
+        batch_layout.addWidget(batch_label)
+        batch_layout.addWidget(self.batch_input)
+        batch_layout.addWidget(batch_file_button)
+        
         # Додаємо поле NSFW з перемикачем
         nsfw_layout = QHBoxLayout()
         nsfw_layout.setAlignment(Qt.AlignLeft)  # Вирівнювання по лівій стороні
@@ -213,33 +237,75 @@ class DownloadApp(QWidget):
         nsfw_layout.addWidget(self.nsfw_checkbox)
         nsfw_layout.addStretch(1)  # Додаємо відступ справа, щоб вирівняти компоненти ліворуч
         
+        # Перемикач продовження з останньої обробленої сторінки
+        resume_layout = QHBoxLayout()
+        resume_layout.setAlignment(Qt.AlignLeft)
+        self.resume_checkbox = QCheckBox('Продовжити з останньої сторінки')
+        self.resume_checkbox.stateChanged.connect(self.update_resume)
+        
+        # Перемикач синхронізації: лише нові зображення
+        self.sync_checkbox = QCheckBox('Лише нові зображення (синхронізація)')
+        self.sync_checkbox.stateChanged.connect(self.update_sync)
+        
+        resume_layout.addWidget(self.resume_checkbox)
+        resume_layout.addWidget(self.sync_checkbox)
+        resume_layout.addStretch(1)
+        
         # 5. Поле для вибору кількості зображень
         limit_layout = QHBoxLayout()
         limit_label = QLabel('кількість зображень:')
         self.limit_input = QSpinBox()
-        self.limit_input.setRange(1, 1000)
+        self.limit_input.setRange(0, 1000000)
+        self.limit_input.setSpecialValueText('без обмеження')  # 0 - усі зображення
         self.limit_input.setValue(100)
         self.limit_input.setSingleStep(10)
+        self.limit_input.valueChanged.connect(self.check_fields)
         
         limit_layout.addWidget(limit_label)
         limit_layout.addWidget(self.limit_input)
         
+        # 6. Поле для вибору кількості одночасних завантажень
+        workers_layout = QHBoxLayout()
+        workers_label = QLabel('одночасних завантажень:')
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(1, 32)
+        self.workers_input.setValue(4)
+        self.workers_input.valueChanged.connect(self.check_fields)
+        
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.workers_input)
+        
         # Лог процесу завантаження
         log_label = QLabel('Лог завантаження:')
         self.log_output = QTextEdit()
         self.log_output.setReadOnly(True)
+        # Кільцевий буфер: найстаріші рядки видаляються, пам'ять не росте
+        self.log_output.document().setMaximumBlockCount(LOG_MAX_LINES)
         
-        # Прогрес-бар
+        # Прогрес-бар: оброблено зображень із знайдених
         self.progress_bar = QProgressBar()
-        self.progress_bar.setRange(0, 0)  # Неперервний прогрес-бар
+        self.progress_bar.setRange(0, 0)  # Неперервний, поки нічого не знайдено
+        self.progress_bar.setFormat("%v / %m")
         self.progress_bar.setVisible(False)
+        self.status_label = QLabel()
+        self.status_label.setVisible(False)
+        
+        # Таймер пакетного оновлення логу та прогресу
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self.log_timer.timeout.connect(self.flush_progress)
         
         # Кнопки
         button_layout = QHBoxLayout()
         self.download_button = QPushButton('Почати завантаження')
-        self.download_button.clicked.connect(self.start_download)
+        self.download_button.clicked.connect(lambda: self.start_download())
         self.download_button.setEnabled(False)
         
+        # Оцінка кількості, обсягу і часу без завантаження зображень
+        self.plan_button = QPushButton('Оцінити')
+        self.plan_button.clicked.connect(lambda: self.start_download(plan=True))
+        self.plan_button.setEnabled(False)
+        
         self.stop_button = QPushButton('Зупинити')
         self.stop_button.clicked.connect(self.stop_download)
         self.stop_button.setEnabled(False)
@@ -248,6 +314,7 @@ class DownloadApp(QWidget):
         self.save_settings_button.clicked.connect(self.save_settings)
         
         button_layout.addWidget(self.download_button)
+        button_layout.addWidget(self.plan_button)
         button_layout.addWidget(self.stop_button)
         button_layout.addWidget(self.save_settings_button)
         
@@ -256,11 +323,15 @@ class DownloadApp(QWidget):
         main_layout.addLayout(api_layout)
         main_layout.addLayout(model_layout)
         main_layout.addLayout(version_layout)
+        main_layout.addLayout(batch_layout)
         main_layout.addLayout(nsfw_layout)
+        main_layout.addLayout(resume_layout)
         main_layout.addLayout(limit_layout)
+        main_layout.addLayout(workers_layout)
         main_layout.addWidget(log_label)
         main_layout.addWidget(self.log_output)
         main_layout.addWidget(self.progress_bar)
+        main_layout.addWidget(self.status_label)
         main_layout.addLayout(button_layout)
         
         self.setLayout(main_layout)
@@ -283,9 +354,28 @@ class DownloadApp(QWidget):
             self.folder_input.setText(folder)
             self.check_fields()
     
+    def browse_batch_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Виберіть файл зі списком моделей', '',
+                                              'Text files (*.txt);;All files (*)')
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    jobs = parse_job_list(f.read())
+            except (OSError, ValueError) as e:
+                QMessageBox.critical(self, 'Помилка', f'Не вдалося прочитати список моделей: {str(e)}')
+                return
+            self.batch_input.setText(", ".join(
+                f"{model_id}:{version_id}" if version_id else model_id for model_id, version_id in jobs))
+    
     def update_nsfw(self, state):
         self.nsfw = 'X' if state == Qt.Checked else 'none'
     
+    def update_resume(self, state):
+        self.resume = state == Qt.Checked
+    
+    def update_sync(self, state):
+        self.sync = state == Qt.Checked
+    
     def check_fields(self):
         # Отримання тексту з усіх полів, але зберігаємо існуючі значення якщо вони є
         self.api_key = self.api_input.text()
@@ -310,27 +400,33 @@ class DownloadApp(QWidget):
             self.model_version_id = new_version_id
             
         self.image_limit = self.limit_input.value()
+        self.workers = self.workers_input.value()
+        
+        try:
+            self.batch_jobs = parse_job_list(self.batch_input.text())
+        except ValueError:
+            self.batch_jobs = []
         
         # Перевірка заповнення всіх полів
         if (self.download_folder and self.api_key and 
-            self.model_id and self.model_version_id.strip() != ""):
+            ((self.model_id and self.model_version_id.strip() != "") or self.batch_jobs)):
             self.download_button.setEnabled(True)
+            self.plan_button.setEnabled(True)
         else:
             self.download_button.setEnabled(False)
+            self.plan_button.setEnabled(False)
+
+    def current_settings(self):
+        # Налаштування з файлу з поточними значеннями полів вікна
+        return dict(
+            self.settings, download_folder=self.download_folder, api_key=self.api_key,
+            model_id=self.model_id, model_version_id=self.model_version_id,
+            image_limit=self.image_limit, nsfw=self.nsfw, workers=self.workers,
+            resume=self.resume, sync=self.sync)
 
     def save_settings(self):
-        settings = {
-            "download_folder": self.download_folder,
-            "api_key": self.api_key,
-            "model_id": self.model_id,
-            "model_version_id": self.model_version_id,
-            "image_limit": self.image_limit,
-            "nsfw": self.nsfw
-        }
-        
         try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(settings, f)
+            save_settings(self.current_settings(), self.settings_file)
             self.log_output.append("Налаштування збережено!")
             QMessageBox.information(self, 'Налаштування', 'Налаштування успішно збережено!')
         except Exception as e:
@@ -340,17 +436,20 @@ class DownloadApp(QWidget):
     def load_settings_data(self):
         if os.path.exists(self.settings_file):
             try:
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
+                settings = load_settings(self.settings_file)
                 
                 print(f"Завантажено налаштування: {settings}")
                 
-                self.download_folder = settings.get("download_folder", "")
-                self.api_key = settings.get("api_key", "")
-                self.model_id = settings.get("model_id", "")
-                self.model_version_id = settings.get("model_version_id", "")
-                self.image_limit = settings.get("image_limit", 100)
-                self.nsfw = settings.get("nsfw", "X")
+                self.settings = settings
+                self.download_folder = settings["download_folder"]
+                self.api_key = settings["api_key"]
+                self.model_id = settings["model_id"]
+                self.model_version_id = settings["model_version_id"]
+                self.image_limit = settings["image_limit"]
+                self.nsfw = settings["nsfw"]
+                self.workers = settings["workers"]
+                self.resume = settings["resume"]
+                self.sync = settings["sync"]
                 
                 print(f"Дані завантажено - Model ID: {self.model_id}, Version ID: {self.model_version_id}")
             except Exception as e:
@@ -368,6 +467,7 @@ class DownloadApp(QWidget):
                 self.model_input.blockSignals(True)
                 self.version_input.blockSignals(True)
                 self.limit_input.blockSignals(True)
+                self.workers_input.blockSignals(True)
                 
                 # Встановлення значень
                 if self.download_folder:
@@ -380,7 +480,10 @@ class DownloadApp(QWidget):
                     self.version_input.setText(self.model_version_id)
                 
                 self.limit_input.setValue(self.image_limit)
+                self.workers_input.setValue(self.workers)
                 self.nsfw_checkbox.setChecked(self.nsfw == 'X')
+                self.resume_checkbox.setChecked(self.resume)
+                self.sync_checkbox.setChecked(self.sync)
                 
                 # Відновлення сигналів
                 self.folder_input.blockSignals(False)
@@ -388,6 +491,7 @@ class DownloadApp(QWidget):
                 self.model_input.blockSignals(False)
                 self.version_input.blockSignals(False)
                 self.limit_input.blockSignals(False)
+                self.workers_input.blockSignals(False)
                 
                 # Додаємо лаконічне повідомлення про завантаження налаштувань
                 self.log_output.append("Налаштування завантажено!")
@@ -402,7 +506,8 @@ class DownloadApp(QWidget):
         """Встановлює збережені значення в поля UI"""
         # Блокуємо сигнали під час встановлення значень
         widgets = [self.folder_input, self.api_input, self.model_input, 
-                  self.version_input, self.limit_input, self.nsfw_checkbox]
+                  self.version_input, self.limit_input, self.workers_input,
+                  self.nsfw_checkbox, self.resume_checkbox, self.sync_checkbox]
         
         # Блокуємо сигнали
         for widget in widgets:
@@ -420,7 +525,10 @@ class DownloadApp(QWidget):
             self.version_input.setText(self.model_version_id)
         
         self.limit_input.setValue(self.image_limit)
+        self.workers_input.setValue(self.workers)
         self.nsfw_checkbox.setChecked(self.nsfw == 'X')
+        self.resume_checkbox.setChecked(self.resume)
+        self.sync_checkbox.setChecked(self.sync)
         
         # Розблоковуємо сигнали
         for widget in widgets:
@@ -454,24 +562,37 @@ class DownloadApp(QWidget):
         else:
             event.ignore()
 
-    def start_download(self):
+    def start_download(self, plan=False):
+        settings = self.settings
         # Блокування кнопок та оновлення інтерфейсу
         self.download_button.setEnabled(False)
+        self.plan_button.setEnabled(False)
         self.stop_button.setEnabled(True)
+        self.progress_bar.setRange(0, 0)
         self.progress_bar.setVisible(True)
+        self.status_label.setText("")
+        self.status_label.setVisible(True)
         self.log_output.clear()
-        self.log_output.append(f"Початок завантаження зображень.")
+        self.log_output.append("Оцінка завантаження (без передачі зображень)." if plan
+                               else "Початок завантаження зображень.")
         self.log_output.append(f"Папка: {self.download_folder}")
-        self.log_output.append(f"ID моделі: {self.model_id}")
-        self.log_output.append(f"Версія моделі: {self.model_version_id if self.model_version_id else 'Не вказано'}")
-        self.log_output.append(f"Ліміт зображень: {self.image_limit}")
+        if self.batch_jobs:
+            self.log_output.append(f"Пакет моделей: {len(self.batch_jobs)} (одночасно {settings['parallel_jobs']})")
+        else:
+            self.log_output.append(f"ID моделі: {self.model_id}")
+            self.log_output.append(f"Версія моделі: {self.model_version_id if self.model_version_id else 'Не вказано'}")
+        self.log_output.append(f"Ліміт зображень: {self.image_limit or 'без обмеження'} (по {settings['page_size']} на сторінку API)")
         self.log_output.append(f"NSFW: {'Включено' if self.nsfw == 'X' else 'Вимкнено'}")
+        self.log_output.append(f"Одночасних завантажень: {self.workers}")
+        self.log_output.append(f"Ліміт запитів: {settings['rate_limit']}/с (burst {settings['rate_burst']})")
+        self.log_output.append(f"Сортування: {settings['sort']}" + (f", період {settings['period']}" if settings['period'] else ""))
+        if settings["filters"]:
+            self.log_output.append(f"Фільтри: {json.dumps(settings['filters'], ensure_ascii=False)}")
+        self.log_output.append(f"Продовження з останньої сторінки: {'Так' if self.resume else 'Ні'}")
+        self.log_output.append(f"Синхронізація (лише нові): {'Так' if self.sync else 'Ні'}")
         
         # Створення та запуск потоку завантаження
-        self.download_thread = DownloadThread(
-            self.api_key, self.model_id, self.model_version_id, 
-            self.download_folder, self.image_limit, self.nsfw
-        )
+        self.download_thread = DownloadThread(self.current_settings(), jobs=self.batch_jobs, plan=plan)
         
         # Підключення сигналів
         self.download_thread.progress_signal.connect(self.update_log)
@@ -479,7 +600,9 @@ class DownloadApp(QWidget):
         self.download_thread.error_signal.connect(self.download_error)
         
         # Запуск потоку
+        self._last_progress = (time.monotonic(), 0)
         self.download_thread.start()
+        self.log_timer.start()
     
     def stop_download(self):
         if self.download_thread and self.download_thread.isRunning():
@@ -487,24 +610,58 @@ class DownloadApp(QWidget):
             self.download_thread.stop()
     
     def update_log(self, message):
+        # message може містити кілька рядків, накопичених потоком завантаження
         self.log_output.append(message)
         # Прокрутка до нового повідомлення
         self.log_output.verticalScrollBar().setValue(self.log_output.verticalScrollBar().maximum())
     
+    def flush_progress(self):
+        if not self.download_thread:
+            return
+        self.download_thread.flush_progress()
+        progress = self.download_thread.progress()
+        if not progress:
+            return
+        done = (progress["downloaded"] + progress["skipped"] + progress["linked"]
+                + progress["filtered"] + progress["failed"])
+        if progress["seen"]:
+            self.progress_bar.setRange(0, progress["seen"])
+            self.progress_bar.setValue(min(done, progress["seen"]))
+        
+        # Швидкість за час від попереднього оновлення
+        now = time.monotonic()
+        last_time, last_bytes = self._last_progress
+        speed = (progress["bytes"] - last_bytes) / max(now - last_time, 1e-3)
+        self._last_progress = (now, progress["bytes"])
+        self.status_label.setText(
+            f"Завантажено: {progress['downloaded']} ({progress['bytes'] / 1048576:.1f} МБ), "
+            f"пропущено: {progress['skipped']}, пов'язано: {progress['linked']}, "
+            f"відфільтровано: {progress['filtered']}, помилок: {progress['failed']}, швидкість: {speed / 1048576:.2f} МБ/с")
+    
+    def stop_progress(self):
+        # Останні повідомлення потоку потрапляють у лог до підсумку
+        self.log_timer.stop()
+        self.flush_progress()
+        self.progress_bar.setVisible(False)
+    
     def download_finished(self):
-        self.update_log("Завантаження завершено!")
+        self.stop_progress()
+        plan = self.download_thread.plan
+        self.update_log("Оцінку завершено!" if plan else "Завантаження завершено!")
         self.download_button.setEnabled(True)
+        self.plan_button.setEnabled(True)
         self.stop_button.setEnabled(False)
-        self.progress_bar.setVisible(False)
         
         # Показати повідомлення про завершення
-        QMessageBox.information(self, 'Завершено', 'Завантаження зображень завершено!')
+        QMessageBox.information(self, 'Завершено',
+                                'Оцінку завершено, підсумок у лозі.' if plan else 'Завантаження зображень завершено!')
     
     def download_error(self, error_message):
+        self.stop_progress()
         self.update_log(f"ПОМИЛКА: {error_message}")
         self.download_button.setEnabled(True)
+        self.plan_button.setEnabled(True)
         self.stop_button.setEnabled(False)
-        self.progress_bar.setVisible(False)
         
         # Показати повідомлення про помилку
         QMessageBox.critical(self, 'Помилка', f'Сталася помилка під час завантаження:\n{error_message}')